@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the ITM packet decoder
+
+Without arguments a synthetic capture is generated (mostly byte writes to a
+stimulus port, with local timestamps, exception trace, PC samples and
+periodic synchronization packets); pass a path to decode a real SWO capture.
+
+    python benchmarks/itm_decode.py [--size MB] [capture.bin]
+
+===============================================================================
+
+This file is part of PyCortexMDebug
+
+PyCortexMDebug is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCortexMDebug is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from cmdebug.itm import decode_stream
+
+
+def generate_itm(f, size, seed=0):
+    """
+    Write roughly `size` bytes of synthetic ITM trace
+    """
+    rng = random.Random(seed)
+    text = b"tick %d: adc=%d state=%s\n"
+    block = bytearray()
+    while len(block) < 1 << 16:
+        block += b"\x00\x00\x00\x00\x00\x80"
+        for _ in range(50):
+            line = text % (rng.randrange(1 << 20), rng.randrange(4096), rng.choice((b"idle", b"run", b"stop")))
+            for c in line:
+                block += bytes((0x01, c))
+            # Local timestamp, exception entry/exit, a word write to port 1 and a PC sample
+            block += bytes((0xC0, 0x80 | rng.randrange(128), rng.randrange(128)))
+            irq = 16 + rng.randrange(64)
+            block += bytes((0x0E, irq, 0x10, 0x0E, irq, 0x20))
+            block += bytes((0x0B,)) + rng.getrandbits(32).to_bytes(4, "little")
+            block += bytes((0x17,)) + (0x08000000 | rng.getrandbits(16) << 1).to_bytes(4, "little")
+    written = 0
+    while written < size:
+        f.write(block)
+        written += len(block)
+    return written
+
+
+def measure(fname, chunk_size):
+    start = time.perf_counter()
+    with open(fname, "rb") as f:
+        counts = Counter(type(packet).__name__ for packet in decode_stream(f, chunk_size))
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(fname)
+    print(f"file:       {fname} ({size / 1e6:.1f} MB)")
+    for name, count in counts.most_common():
+        print(f"  {name:16} {count}")
+    print(f"time:       {elapsed:.2f} s")
+    print(f"throughput: {size / elapsed / 1e6:.1f} MB/s, {sum(counts.values()) / elapsed / 1e6:.2f} Mpackets/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("capture", nargs="?", help="capture to decode (default: generate a synthetic one)")
+    parser.add_argument("--size", type=float, default=32, help="size of the synthetic capture in MB")
+    parser.add_argument("--chunk", type=int, default=1 << 20, help="read size in bytes")
+    args = parser.parse_args()
+
+    if args.capture:
+        measure(args.capture, args.chunk)
+        return
+
+    with tempfile.NamedTemporaryFile("wb", suffix=".itm", delete=False) as f:
+        generate_itm(f, int(args.size * 1e6))
+    try:
+        measure(f.name, args.chunk)
+    finally:
+        os.unlink(f.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Startup time benchmark for scripts/gdb.py
+
+Compares the wall-clock time of a batch gdb session that does nothing, one
+that sources scripts/gdb.py (lazy command stubs) and one that imports and
+registers all commands eagerly, as scripts/gdb.py used to.
+
+    python benchmarks/startup_time.py [--gdb arm-none-eabi-gdb] [--runs 20]
+
+===============================================================================
+
+This file is part of PyCortexMDebug
+
+PyCortexMDebug is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCortexMDebug is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+EAGER = ("python import sys; sys.path.insert(0, {!r}); "
+         "from cmdebug.svd_gdb import LoadSVD; from cmdebug.dwt_gdb import DWT; DWT(); LoadSVD()").format(ROOT)
+
+VARIANTS = [
+    ("gdb only", []),
+    ("lazy (scripts/gdb.py)", ["-ex", "source " + os.path.join(ROOT, "scripts", "gdb.py")]),
+    ("eager imports", ["-ex", EAGER]),
+]
+
+
+def run(gdb, extra, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([gdb, "-nx", "-batch"] + extra, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--gdb", default="gdb", help="gdb executable (default: gdb)")
+    parser.add_argument("--runs", type=int, default=20, help="runs per variant (default: 20)")
+    args = parser.parse_args()
+
+    baseline = None
+    for name, extra in VARIANTS:
+        median = statistics.median(run(args.gdb, extra, args.runs))
+        if baseline is None:
+            baseline = median
+            print("{:24} {:7.1f} ms".format(name, median * 1e3))
+        else:
+            print("{:24} {:7.1f} ms  (+{:.1f} ms)".format(name, median * 1e3, (median - baseline) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark for the SVD model
+
+Measures the memory retained by a parsed SVDFile using tracemalloc. Without
+arguments a large synthetic SVD file is generated (dozens of peripherals with
+derived instances, 50k+ fields); pass a path to measure a real vendor file.
+
+    python benchmarks/svd_memory.py [--lazy] [file.svd]
+
+===============================================================================
+
+This file is part of PyCortexMDebug
+
+PyCortexMDebug is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCortexMDebug is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from cmdebug.svd import SVDFile
+
+
+def generate_svd(f, peripherals=60, derived=4, registers=64, fields=14, enums=4):
+    """
+    Write a synthetic SVD file
+
+    Every base peripheral gets `derived` derivedFrom instances, so the total
+    number of fields is peripherals * (1 + derived) * registers * fields.
+    """
+    f.write('<?xml version="1.0" encoding="utf-8"?>\n<device schemaVersion="1.1">\n')
+    f.write('<name>SYNTH</name>\n<peripherals>\n')
+    address = 0x40000000
+    for p in range(peripherals):
+        f.write(f'<peripheral><name>PERIPH{p}_0</name><description>Synthetic peripheral {p}</description>'
+                f'<baseAddress>{address:#x}</baseAddress><registers>\n')
+        for r in range(registers):
+            f.write(f'<register><name>REG{r}</name><description>Register {r} of peripheral {p}</description>'
+                    f'<addressOffset>{r * 4:#x}</addressOffset><size>32</size><access>read-write</access><fields>')
+            for b in range(fields):
+                f.write(f'<field><name>FIELD{b}</name><description>Field {b}</description>'
+                        f'<bitOffset>{b * 2}</bitOffset><bitWidth>2</bitWidth>')
+                if b < enums:
+                    f.write('<enumeratedValues>')
+                    for v in range(4):
+                        f.write(f'<enumeratedValue><name>VAL{v}</name><description>Value {v}</description>'
+                                f'<value>{v}</value></enumeratedValue>')
+                    f.write('</enumeratedValues>')
+                f.write('</field>')
+            f.write('</fields></register>\n')
+        f.write('</registers></peripheral>\n')
+        address += 0x400
+        for d in range(1, derived + 1):
+            f.write(f'<peripheral derivedFrom="PERIPH{p}_0"><name>PERIPH{p}_{d}</name>'
+                    f'<baseAddress>{address:#x}</baseAddress></peripheral>\n')
+            address += 0x400
+    f.write('</peripherals>\n</device>\n')
+
+
+def measure(fname, lazy=False):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    svd = SVDFile(fname, lazy)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    n_regs = n_fields = 0
+    if not lazy:
+        for p in svd.peripherals.values():
+            regs = list(p.registers.values())
+            for c in p.clusters.values():
+                regs.extend(c.registers.values())
+            n_regs += len(regs)
+            n_fields += sum(len(r.fields) for r in regs)
+
+    print(f"file:        {fname} ({os.path.getsize(fname) / 1e6:.1f} MB)")
+    print(f"peripherals: {len(svd.peripherals)}")
+    if not lazy:
+        print(f"registers:   {n_regs}")
+        print(f"fields:      {n_fields}")
+    print(f"parse time:  {elapsed:.2f} s (under tracemalloc)")
+    print(f"retained:    {retained / 1e6:.1f} MB")
+    print(f"peak:        {peak / 1e6:.1f} MB")
+    return svd
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("svd", nargs="?", help="SVD file to measure (default: generate a synthetic one)")
+    parser.add_argument("--lazy", action="store_true", help="parse peripherals lazily")
+    args = parser.parse_args()
+
+    if args.svd:
+        measure(args.svd, args.lazy)
+        return
+
+    with tempfile.NamedTemporaryFile("w", suffix=".svd", delete=False) as f:
+        generate_svd(f)
+    try:
+        measure(f.name, args.lazy)
+    finally:
+        os.unlink(f.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the TPIU deformatter
+
+A synthetic capture interleaving several trace sources (including delayed ID
+changes and periodic frame synchronization packets) is generated, split with
+both the NumPy and the pure Python deformatter, and checked against the
+original per-source streams.
+
+    python benchmarks/tpiu_deformat.py [--size MB] [--sources N]
+
+===============================================================================
+
+This file is part of PyCortexMDebug
+
+PyCortexMDebug is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCortexMDebug is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from cmdebug import tpiu
+
+
+def format_frames(items, sync_every=64):
+    """
+    TPIU formatter: turn a list of (source ID, byte) into frames
+
+    Uses a delayed ID change whenever the source changes right after an even slot.
+    """
+    out = bytearray(tpiu.FRAME_SYNC)
+    current = tpiu.NULL_ID
+    i = 0
+    n = len(items)
+    frames = 0
+    while i < n:
+        frame = bytearray(16)
+        aux = 0
+        for slot in range(15):
+            if slot % 2 == 0:
+                k = slot // 2
+                if i >= n:
+                    # Pad with the null source
+                    frame[slot] = 1
+                    current = tpiu.NULL_ID
+                elif items[i][0] != current:
+                    frame[slot] = (items[i][0] << 1) | 1
+                    current = items[i][0]
+                elif slot < 14 and (items[i + 1][0] if i + 1 < n else tpiu.NULL_ID) != current:
+                    # New ID now, this source's byte goes in the odd slot that follows
+                    current = items[i + 1][0] if i + 1 < n else tpiu.NULL_ID
+                    frame[slot] = (current << 1) | 1
+                    aux |= 1 << k
+                    frame[slot + 1] = items[i][1]
+                    i += 1
+                else:
+                    frame[slot] = items[i][1] & 0xFE
+                    aux |= (items[i][1] & 1) << k
+                    i += 1
+            elif frame[slot - 1] & 1 and aux >> (slot // 2) & 1:
+                # Already filled by a delayed ID change
+                continue
+            else:
+                frame[slot] = items[i][1] if i < n else 0
+                i += 1 if i < n else 0
+        frame[15] = aux
+        out += frame
+        frames += 1
+        if frames % sync_every == 0:
+            out += tpiu.FRAME_SYNC
+    return bytes(out)
+
+
+def generate(size, sources, seed=0):
+    rng = random.Random(seed)
+    items = []
+    expected = {s: bytearray() for s in range(1, sources + 1)}
+    source = 1
+    while len(items) < size:
+        # Runs of a few to a few dozen bytes per source
+        for _ in range(rng.choice((1, 2, 3, 8, 40))):
+            b = rng.randrange(256)
+            items.append((source, b))
+            expected[source].append(b)
+        source = rng.randrange(1, sources + 1)
+    return format_frames(items), {s: bytes(d) for s, d in expected.items() if d}
+
+
+def measure(capture, expected, use_numpy, chunk_size=1 << 20):
+    deformatter = tpiu.TPIUDeformatter(use_numpy)
+    streams = {}
+    start = time.perf_counter()
+    for i in range(0, len(capture), chunk_size):
+        for source, data in deformatter.feed(capture[i:i + chunk_size]).items():
+            streams.setdefault(source, bytearray()).extend(data)
+    elapsed = time.perf_counter() - start
+    ok = {s: bytes(d) for s, d in streams.items()} == expected
+    print(f"{'numpy' if use_numpy else 'python':7} {elapsed:6.2f} s  {len(capture) / elapsed / 1e6:7.1f} MB/s  "
+          f"{deformatter.frames} frames  {'ok' if ok else 'MISMATCH'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=float, default=8, help="payload of the synthetic capture in MB")
+    parser.add_argument("--sources", type=int, default=3, help="number of interleaved trace sources")
+    args = parser.parse_args()
+
+    capture, expected = generate(int(args.size * 1e6), args.sources)
+    print(f"capture: {len(capture) / 1e6:.1f} MB, {args.sources} sources")
+    ok = True
+    if tpiu.numpy is not None:
+        ok &= measure(capture, expected, True)
+    else:
+        print("numpy    not installed")
+    ok &= measure(capture, expected, False)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
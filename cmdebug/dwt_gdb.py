@@ -17,6 +17,15 @@ along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
 
 import gdb
 import struct
+import sys
+import threading
+import time
+from collections import Counter
+
+from cmdebug.irqstats import irq_stats
+from cmdebug.itm import decode_stream
+from cmdebug.stats import RunningStats
+from cmdebug.trace import TS_PRESCALERS, export_chrome_trace
 
 DWT_CTRL = 0xE0001000
 DWT_CYCCNT = 0xE0001004
@@ -27,36 +36,339 @@ DWT_LSUCNT = 0xE0001014
 DWT_FOLDCNT = 0xE0001018
 DWT_PCSR = 0xE000101C
 
+ITM_TCR = 0xE0000E80
+ITM_LAR = 0xE0000FB0
+
+ITM_LAR_KEY = 0xC5ACCE55
+# ITM_TCR: ITMENA, TSENA (local timestamps), SYNCENA and TXENA (forward DWT packets)
+ITM_TCR_TRACE = 0x0F
+
+# DWT_CTRL.EXCTRCENA
+DWT_EXCTRCENA = 16
+
+# Size of the block from DWT_CTRL to DWT_PCSR, read in one go for snapshots
+DWT_BLOCK_SIZE = DWT_PCSR + 4 - DWT_CTRL
+
+# Counter name: (address, DWT_CTRL enable bit, width in bits)
+COUNTERS = {
+    "cyccnt": (DWT_CYCCNT, 0, 32),
+    "cpicnt": (DWT_CPICNT, 17, 8),
+    "exccnt": (DWT_EXTCNT, 18, 8),
+    "sleepcnt": (DWT_SLEEPCNT, 19, 8),
+    "lsucnt": (DWT_LSUCNT, 20, 8),
+    "foldcnt": (DWT_FOLDCNT, 21, 8),
+}
+
+# The 8 bit profiling counters, everything but CYCCNT
+PROFILING_COUNTERS = ["cpicnt", "exccnt", "sleepcnt", "lsucnt", "foldcnt"]
+
+COUNTER_DESCRIPTIONS = {
+    "cyccnt": "cycles",
+    "cpicnt": "extra cycles per instruction",
+    "exccnt": "exception overhead cycles",
+    "sleepcnt": "sleep cycles",
+    "lsucnt": "extra load/store cycles",
+    "foldcnt": "folded instructions",
+}
+
 prefix = "dwt : "
 
+# PCSR reads as this while the core is halted or no sample is available
+PCSR_NO_SAMPLE = 0xFFFFFFFF
+
+
+class CycleTimeline:
+    """ Extends the 32 bit CYCCNT to 64 bits by tracking every observation of it
+
+    Each observation adds the (modulo 2^32) difference to the previous one to
+    a running total, so wraps are accounted for as long as the counter is
+    observed at least once per wrap period. The DWT command observes it on
+    every stop of the target, and on every read it makes.
+    """
+
+    def __init__(self):
+        self.last = None
+        self.total = 0
+        self.observations = 0
+
+    @property
+    def tracking(self):
+        return self.last is not None
+
+    @property
+    def wraps(self):
+        return self.total >> 32
+
+    def reset(self, value=0):
+        self.last = value & 0xFFFFFFFF
+        self.total = self.last
+        self.observations = 0
+
+    def observe(self, raw):
+        """ Record a raw CYCCNT value and return the extended cycle count
+        """
+        raw &= 0xFFFFFFFF
+        if self.last is None:
+            # Assume nothing wrapped before we started tracking
+            self.total = raw
+        else:
+            self.total += (raw - self.last) & 0xFFFFFFFF
+        self.last = raw
+        self.observations += 1
+        return self.total
+
+
+class PCSampler:
+    """ Statistical profiler sampling DWT_PCSR while the target runs
+
+    A timer thread asks gdb's main thread (through gdb.post_event) to read
+    PCSR at the configured rate. Reading memory while the core runs needs a
+    target that allows it, e.g. OpenOCD with "set non-stop on" and
+    "continue &". At most one read is queued at a time, so if gdb can't keep
+    up the effective rate drops instead of events piling up.
+    """
+
+    def __init__(self):
+        self.histogram = Counter()
+        self.missed = 0
+        self.rate = 0
+        self.running = False
+        self.pending = False
+        self.thread = None
+        # Bumped by every start and stop, so a timer thread from an earlier run
+        # that is still sleeping exits instead of sampling alongside the new one
+        self.generation = 0
+        self.symbols = {}
+
+    def start(self, rate):
+        if self.running:
+            return
+        self.rate = rate
+        self.running = True
+        self.generation += 1
+        self.thread = threading.Thread(target=self._timer, args=(self.generation, 1.0 / rate),
+                                       name="dwt_profile", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.generation += 1
+
+    def clear(self):
+        self.histogram.clear()
+        self.missed = 0
+
+    def _timer(self, generation, period):
+        while self.generation == generation:
+            if not self.pending:
+                self.pending = True
+                gdb.post_event(self._sample)
+            time.sleep(period)
+
+    def _sample(self):
+        self.pending = False
+        if not self.running:
+            return
+        try:
+            pc = struct.unpack_from("<I", gdb.selected_inferior().read_memory(DWT_PCSR, 4))[0]
+        except gdb.error:
+            self.missed += 1
+            return
+        if pc == PCSR_NO_SAMPLE:
+            self.missed += 1
+        else:
+            self.histogram[pc & ~1] += 1
+
+    def symbolize(self, pc):
+        """ Get the (function, "file:line") location of an address, cached per address
+        """
+        if pc not in self.symbols:
+            function = None
+            try:
+                block = gdb.block_for_pc(pc)
+                while block is not None and block.function is None:
+                    block = block.superblock
+                if block is not None:
+                    function = block.function.print_name
+            except RuntimeError:
+                pass
+            if function is None:
+                function = "0x{:08x}".format(pc)
+            sal = gdb.find_pc_line(pc)
+            if sal.symtab is not None:
+                line = "{}:{}".format(sal.symtab.filename, sal.line)
+            else:
+                line = "0x{:08x}".format(pc)
+            self.symbols[pc] = (function, line)
+        return self.symbols[pc]
+
+    def by_location(self):
+        """ Sample counts aggregated by (function, "file:line")
+        """
+        locations = Counter()
+        for pc, count in self.histogram.items():
+            locations[self.symbolize(pc)] += count
+        return locations
+
+    def report(self, limit=20):
+        total = sum(self.histogram.values())
+        gdb.write(prefix + "{} samples ({} missed){}\n".format(
+            total, self.missed, ", running" if self.running else ""))
+        if not total:
+            return
+        functions = Counter()
+        for (function, _), count in self.by_location().items():
+            functions[function] += count
+        for function, count in functions.most_common(limit):
+            gdb.write("\t{:6.2f}% {:8d}  {}\n".format(100.0 * count / total, count, function))
+
+    def export(self, fname):
+        """ Write the profile in collapsed stack format ("function;file:line count"), as used by flamegraph.pl
+        """
+        with open(fname, "w") as f:
+            for (function, line), count in sorted(self.by_location().items()):
+                f.write("{};{} {}\n".format(function, line, count))
+
+
+class CycleBreakpoint(gdb.Breakpoint):
+    """ Breakpoint that hands CYCCNT to a measurement instead of stopping the target
+    """
+
+    def __init__(self, spec, measurement, is_start):
+        gdb.Breakpoint.__init__(self, spec, internal=True)
+        self.measurement = measurement
+        self.is_start = is_start
+
+    def stop(self):
+        cycles = DWT.read(DWT_CYCCNT)
+        if self.is_start:
+            return self.measurement.start(cycles)
+        return self.measurement.end(cycles)
+
+
+class Measurement:
+    """ Cycle counts between two breakpoints over a number of iterations
+
+    The start breakpoint snapshots CYCCNT and the end breakpoint records the
+    cycles elapsed since, both without returning to the prompt. The target
+    only stops once the requested number of iterations has been measured.
+    CYCCNT does not count while the core is halted, so the breakpoints
+    themselves do not add to the measured cycles.
+    """
+
+    def __init__(self, start_spec, end_spec, iterations):
+        self.start_spec = start_spec
+        self.end_spec = end_spec
+        self.iterations = iterations
+        self.stats = RunningStats((0.5, 0.99))
+        self.started_at = None
+        self.reported = False
+        self.breakpoints = [CycleBreakpoint(start_spec, self, True), CycleBreakpoint(end_spec, self, False)]
+
+    @property
+    def done(self):
+        return self.stats.count >= self.iterations
+
+    def start(self, cycles):
+        self.started_at = cycles
+        return False
+
+    def end(self, cycles):
+        if self.started_at is None:
+            # Reached the end without passing the start first
+            return False
+        self.stats.add((cycles - self.started_at) & 0xFFFFFFFF)
+        self.started_at = None
+        if self.done:
+            # Breakpoints can't be deleted from within stop()
+            gdb.post_event(self.delete)
+            return True
+        return False
+
+    def delete(self):
+        for bp in self.breakpoints:
+            if bp.is_valid():
+                bp.delete()
+        self.breakpoints = []
+
+    def report(self, clk=None):
+        gdb.write(prefix + "{} -> {}: {}/{} iterations{}\n".format(
+            self.start_spec, self.end_spec, self.stats.count, self.iterations, "" if self.done else ", running"))
+        if not self.stats.count:
+            return
+        for label, value in self.stats.summary()[1:]:
+            line = "\t{:5} {:12.1f} cycles".format(label, value)
+            if clk:
+                line += "  {:.3e}s".format(value / clk)
+            gdb.write(line + "\n")
+
 
 class DWT(gdb.Command):
+    """ Configure and read the DWT cycle counter, PC sampling and exception trace
+    """
+
     clk = None
     is_init = False
 
     def __init__(self):
         gdb.Command.__init__(self, "dwt", gdb.COMMAND_DATA)
+        self.profiler = PCSampler()
+        self.timeline = CycleTimeline()
+        self.measurement = None
+        gdb.events.stop.connect(self.on_stop)
 
     @staticmethod
     def read(address, bits=32):
         """ Read from memory (using print) and return an integer
         """
         value = gdb.selected_inferior().read_memory(address, bits / 8)
-        return struct.unpack_from("<i", value)[0]
+        return struct.unpack_from("<I", value)[0]
+
+    @staticmethod
+    def read_block():
+        """ Read DWT_CTRL through DWT_PCSR with a single memory transaction
+
+        Returns:
+            A dict mapping register addresses to their values, so that all
+            counters come from one consistent snapshot
+        """
+        value = gdb.selected_inferior().read_memory(DWT_CTRL, DWT_BLOCK_SIZE)
+        words = struct.unpack_from("<{}I".format(DWT_BLOCK_SIZE // 4), value)
+        return {DWT_CTRL + 4 * i: word for i, word in enumerate(words)}
 
     @staticmethod
     def write(address, value, bits=32):
         """ Set a value in memory
         """
-        gdb.selected_inferior().write_memory(address, bytes(value), bits / 8)
+        data = struct.pack("<I", value & 0xFFFFFFFF)[:bits // 8]
+        gdb.selected_inferior().write_memory(address, data, bits // 8)
 
-    def invoke(self, args, from_tty):
+    def init(self):
+        """ Enable the DWT and ITM, once per session
+        """
         if not self.is_init:
+            # Only set DEMCR.TRCENA, counters the firmware enabled itself (e.g. for delays) stay on
             self.write(0xE000EDFC, self.read(0xE000EDFC) | (1 << 24))
-            self.write(DWT_CTRL, 0)
             self.is_init = True
 
-        s = list(map(lambda x: x.lower(), str(args).split(" ")))
+    @staticmethod
+    def uses_target(s):
+        """ Whether a subcommand accesses the target, rather than only files or settings
+        """
+        if s[0] in ("", "help", "configclk", "trace"):
+            return False
+        if s[0] == "exctrace" and len(s) > 1 and s[1] == "stats":
+            return False
+        if s[0] == "profile" and (len(s) == 1 or s[1] in ("report", "clear", "export")):
+            return False
+        return True
+
+    def invoke(self, args, from_tty):
+        raw = str(args).split(" ")
+        s = list(map(lambda x: x.lower(), raw))
+        if self.uses_target(s):
+            self.init()
+
         # Check for empty command
         if s[0] in ['', 'help']:
             self.print_help()
@@ -70,23 +382,49 @@ class DWT(gdb.Command):
                     self.cyccnt_reset()
                 elif s[1][0] == "d":
                     self.cyccnt_dis()
-            gdb.write(prefix + "CYCCNT ({}): ".format("ON" if (self.read(DWT_CTRL) & 1) else "OFF") +
-                      self.cycles_str(self.read(DWT_CYCCNT)))
-        elif s[0] == "reset":
+            snapshot = self.read_block()
+            gdb.write(prefix + "CYCCNT ({}): ".format("ON" if snapshot[DWT_CTRL] & 1 else "OFF") +
+                      self.cyccnt_str(snapshot[DWT_CYCCNT]))
+        elif s[0] in PROFILING_COUNTERS:
             if len(s) > 1:
-                if s[1] == "cyccnt":
-                    self.cyccnt_reset()
-                    gdb.write(prefix + "CYCCNT reset\n")
-                if s[1] == "counters":
-                    self.cyccnt_reset()
-                    gdb.write(prefix + "CYCCNT reset\n")
-                else:
-                    self.cyccnt_reset()
-                    gdb.write(prefix + "CYCCNT reset\n")
+                if s[1][:2] == "en":
+                    self.counter_en(s[0])
+                elif s[1][0] == "r":
+                    self.counter_reset(s[0])
+                elif s[1][0] == "d":
+                    self.counter_dis(s[0])
+            snapshot = self.read_block()
+            gdb.write(prefix + self.counter_str(s[0], snapshot))
+        elif s[0] == "counters":
+            names = PROFILING_COUNTERS
+            if len(s) > 1:
+                if s[1][:2] == "en":
+                    for name in names:
+                        self.counter_en(name)
+                elif s[1][0] == "r":
+                    for name in names:
+                        self.counter_reset(name)
+                elif s[1][0] == "d":
+                    for name in names:
+                        self.counter_dis(name)
+            self.print_counters()
+        elif s[0] == "reset":
+            if len(s) > 1 and s[1] in COUNTERS:
+                self.counter_reset(s[1])
+                gdb.write(prefix + "{} reset\n".format(s[1].upper()))
             else:
                 # Reset everything
-                self.cyccnt_reset()
-                gdb.write(prefix + "CYCCNT reset\n")
+                for name in COUNTERS:
+                    self.counter_reset(name)
+                gdb.write(prefix + "All counters reset\n")
+        elif s[0] == "profile":
+            self.profile(s[1:], raw[1:])
+        elif s[0] == "measure":
+            self.measure(s[1:], raw[1:])
+        elif s[0] == "trace":
+            self.trace(s[1:], raw[1:])
+        elif s[0] == "exctrace":
+            self.exctrace(s[1:], raw[1:])
         elif s[0] == "configclk":
             if len(s) == 2:
                 try:
@@ -105,24 +443,43 @@ class DWT(gdb.Command):
         text = str(text).lower()
         s = text.split(" ")
 
-        commands = ['configclk', 'reset', 'cyccnt']
-        reset_commands = ['counters', 'cyccnt']
+        commands = ['configclk', 'reset', 'counters', 'profile', 'measure', 'trace', 'exctrace'] + list(COUNTERS)
+        reset_commands = ['counters'] + list(COUNTERS)
         cyccnt_commands = ['enable', 'reset', 'disable']
+        profile_commands = ['start', 'stop', 'report', 'export', 'clear']
 
         if len(s) == 1:
-            return filter(lambda x: x.startswith(s[0]), commands)
+            return [x for x in commands if x.startswith(s[0])]
 
         if len(s) == 2:
             if s[0] == 'reset':
-                return filter(lambda x: x.startswith(s[1]), reset_commands)
-            if s[0] == 'cyccnt':
-                return filter(lambda x: x.startswith(s[1]), cyccnt_commands)
+                return [x for x in reset_commands if x.startswith(s[1])]
+            if s[0] in COUNTERS or s[0] == 'counters':
+                return [x for x in cyccnt_commands if x.startswith(s[1])]
+            if s[0] == 'profile':
+                return [x for x in profile_commands if x.startswith(s[1])]
+            if s[0] == 'trace':
+                return [x for x in ['export'] if x.startswith(s[1])]
+            if s[0] == 'exctrace':
+                return [x for x in ['enable', 'disable', 'stats'] if x.startswith(s[1])]
+
+        if s[0] in ('trace', 'exctrace'):
+            return gdb.COMPLETE_FILENAME
 
     def cycles_str(self, cycles):
         if self.clk:
             return "%d cycles, %.3es\n" % (cycles, cycles * 1.0 / self.clk)
         else:
-            return "%d cycles"
+            return "%d cycles\n" % cycles
+
+    def cyccnt_str(self, raw):
+        """ Describe a raw CYCCNT value using the wrap-extended count
+        """
+        cycles = self.timeline.observe(raw)
+        s = self.cycles_str(cycles)
+        if self.timeline.wraps:
+            s = s[:-1] + " (raw 0x{:08X}, wrapped {} times)\n".format(raw, self.timeline.wraps)
+        return s
 
     def cyccnt_en(self):
         self.write(DWT_CTRL, self.read(DWT_CTRL) | 1)
@@ -131,11 +488,162 @@ class DWT(gdb.Command):
         self.write(DWT_CTRL, self.read(DWT_CTRL) & 0xFFFFFFFE)
 
     def cyccnt_reset(self, value=0):
-        self.write(DWT_CYCCNT, value)
+        self.counter_reset("cyccnt", value)
 
     def cpicnt_reset(self, value=0):
         self.write(DWT_CPICNT, value & 0xFF)
 
+    def measure(self, s, raw):
+        if not s or s[0] == "report":
+            if self.measurement is None:
+                gdb.write(prefix + "No measurement\n")
+            else:
+                self.measurement.report(self.clk)
+        elif s[0] == "stop":
+            if self.measurement is not None:
+                self.measurement.delete()
+                self.measurement.report(self.clk)
+        elif len(s) in (2, 3):
+            try:
+                iterations = int(s[2]) if len(s) == 3 else 100
+            except ValueError:
+                self.print_help()
+                return
+            if self.measurement is not None:
+                self.measurement.delete()
+            self.cyccnt_en()
+            self.measurement = Measurement(raw[0], raw[1], iterations)
+            gdb.write(prefix + "Measuring cycles from {} to {} over {} iterations, continue to start\n".format(
+                raw[0], raw[1], iterations))
+        else:
+            self.print_help()
+
+    def on_stop(self, event):
+        """ Observe CYCCNT on every stop so wraps between stops are counted, and report finished measurements
+        """
+        if self.measurement is not None and self.measurement.done and not self.measurement.reported:
+            self.measurement.reported = True
+            self.measurement.report(self.clk)
+        if not self.timeline.tracking:
+            return
+        try:
+            self.timeline.observe(self.read(DWT_CYCCNT))
+        except gdb.error:
+            pass
+
+    def timestamp_prescaler(self):
+        try:
+            return TS_PRESCALERS[(self.read(ITM_TCR) >> 8) & 3]
+        except gdb.error:
+            return 1
+
+    def exctrace(self, s, raw):
+        if not s:
+            state = "ON" if self.read(DWT_CTRL) & (1 << DWT_EXCTRCENA) else "OFF"
+            gdb.write(prefix + "Exception trace: {}\n".format(state))
+        elif s[0][:2] == "en":
+            # Exception trace goes out through the ITM, with local timestamps to time it
+            self.write(ITM_LAR, ITM_LAR_KEY)
+            self.write(ITM_TCR, self.read(ITM_TCR) | ITM_TCR_TRACE)
+            self.write(DWT_CTRL, self.read(DWT_CTRL) | (1 << DWT_EXCTRCENA))
+            gdb.write(prefix + "Exception trace enabled, SWO output must be configured to capture it\n")
+        elif s[0][0] == "d":
+            self.write(DWT_CTRL, self.read(DWT_CTRL) & ~(1 << DWT_EXCTRCENA))
+            gdb.write(prefix + "Exception trace disabled\n")
+        elif s[0] == "stats" and len(raw) > 1:
+            try:
+                with open(raw[1], "rb") as f:
+                    stats = irq_stats(decode_stream(f), self.timestamp_prescaler())
+            except OSError as e:
+                raise gdb.GdbError(str(e))
+            for line in stats.report(self.clk, self.exception_names(), histograms=len(s) < 3 or s[2] != "summary"):
+                gdb.write(line + "\n")
+        else:
+            self.print_help()
+
+    @staticmethod
+    def exception_names():
+        """ Interrupt names from the SVD file loaded with svd_load, if any
+        """
+        svd_gdb = sys.modules.get("cmdebug.svd_gdb")
+        svd_file = svd_gdb.loaded_svd_file() if svd_gdb is not None else None
+        return svd_file.exception_name if svd_file is not None else None
+
+    def trace(self, s, raw):
+        if len(s) != 3 or s[0] != "export":
+            self.print_help()
+            return
+        try:
+            with open(raw[1], "rb") as f, open(raw[2], "w") as out:
+                events = export_chrome_trace(decode_stream(f), out, self.clk, self.timestamp_prescaler(),
+                                             self.exception_names())
+        except OSError as e:
+            raise gdb.GdbError(str(e))
+        gdb.write(prefix + "{} events written to {}{}\n".format(
+            events, raw[2], "" if self.clk else ", timestamps are in ticks (no clock set with configclk)"))
+
+    def profile(self, s, raw):
+        if not s or s[0] == "report":
+            try:
+                limit = int(s[1]) if len(s) > 1 else 20
+            except ValueError:
+                self.print_help()
+                return
+            self.profiler.report(limit)
+        elif s[0] == "start":
+            try:
+                rate = float(s[1]) if len(s) > 1 else 100.0
+            except ValueError:
+                self.print_help()
+                return
+            if self.profiler.running:
+                raise gdb.GdbError("Already sampling PCSR at {:g} Hz, use dwt profile stop first\n".format(
+                    self.profiler.rate))
+            # PCSR only samples with CYCCNT running
+            self.cyccnt_en()
+            self.profiler.start(rate)
+            gdb.write(prefix + "Sampling PCSR at {:g} Hz\n".format(rate))
+        elif s[0] == "stop":
+            self.profiler.stop()
+            self.profiler.report()
+        elif s[0] == "clear":
+            self.profiler.clear()
+        elif s[0] == "export" and len(raw) > 1:
+            self.profiler.export(raw[1])
+            gdb.write(prefix + "Profile written to {}\n".format(raw[1]))
+        else:
+            self.print_help()
+
+    def counter_en(self, name):
+        self.write(DWT_CTRL, self.read(DWT_CTRL) | (1 << COUNTERS[name][1]))
+
+    def counter_dis(self, name):
+        self.write(DWT_CTRL, self.read(DWT_CTRL) & ~(1 << COUNTERS[name][1]))
+
+    def counter_reset(self, name, value=0):
+        address, _, width = COUNTERS[name]
+        self.write(address, value & ((1 << width) - 1))
+        if name == "cyccnt":
+            self.timeline.reset(value)
+
+    def counter_str(self, name, snapshot):
+        address, bit, width = COUNTERS[name]
+        state = "ON" if snapshot[DWT_CTRL] & (1 << bit) else "OFF"
+        value = snapshot[address] & ((1 << width) - 1)
+        return "{} ({}): {} {}\n".format(name.upper(), state, value, COUNTER_DESCRIPTIONS[name])
+
+    def print_counters(self):
+        """ Show all counters from a single snapshot of the DWT registers
+        """
+        snapshot = self.read_block()
+        gdb.write(prefix + "CYCCNT ({}): ".format("ON" if snapshot[DWT_CTRL] & 1 else "OFF") +
+                  self.cyccnt_str(snapshot[DWT_CYCCNT]))
+        for name in PROFILING_COUNTERS:
+            gdb.write(prefix + self.counter_str(name, snapshot))
+        pcsr = snapshot[DWT_PCSR]
+        if pcsr != 0xFFFFFFFF:
+            gdb.write(prefix + "PCSR: 0x{:08X}\n".format(pcsr))
+
     @staticmethod
     def print_help():
         gdb.write("Usage:\n")
@@ -148,8 +656,28 @@ class DWT(gdb.Command):
         gdb.write("\tReset everything in DWT\n")
         gdb.write("dwt reset counters:\n")
         gdb.write("\tReset all DWT counters\n")
-        gdb.write("dwt cyccnt\n")
+        gdb.write("dwt cyccnt [enable|disable|reset]\n")
         gdb.write("\tDisplay the cycle count\n")
+        gdb.write("dwt [cpicnt|exccnt|sleepcnt|lsucnt|foldcnt] [enable|disable|reset]\n")
+        gdb.write("\tDisplay one of the 8 bit profiling counters\n")
+        gdb.write("dwt counters [enable|disable|reset]\n")
+        gdb.write("\tDisplay all counters from one snapshot, optionally acting on all profiling counters\n")
+        gdb.write("dwt profile start [Hz]\n")
+        gdb.write("\tSample the PC through DWT_PCSR while the target runs (default 100 Hz)\n")
+        gdb.write("dwt profile [stop|clear|report [N]]\n")
+        gdb.write("\tStop sampling, discard samples or show the N hottest functions\n")
+        gdb.write("dwt measure [start] [end] [N]\n")
+        gdb.write("\tMeasure the cycles from breakpoint location start to end over N iterations (default 100)\n")
+        gdb.write("dwt measure [report|stop]\n")
+        gdb.write("\tShow min/max/mean/p50/p99 so far, or stop measuring\n")
+        gdb.write("dwt exctrace [enable|disable]\n")
+        gdb.write("\tEnable/disable DWT exception trace (and ITM timestamps) on the SWO output\n")
+        gdb.write("dwt exctrace stats [capture] [summary]\n")
+        gdb.write("\tPer interrupt count, time, nesting and duration histograms from a captured trace\n")
+        gdb.write("dwt trace export [capture] [file]\n")
+        gdb.write("\tConvert a captured SWO/ITM trace to Chrome trace JSON, timed with the configclk clock\n")
+        gdb.write("dwt profile export [file]\n")
+        gdb.write("\tWrite the samples in collapsed stack format for flamegraph tools\n")
         gdb.write("\td(default):decimal, x: hex, o: octal, b: binary\n")
         return
 
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Interrupt latency statistics from DWT exception trace
+
+Exception entry/exit/return packets, timed by TimestampReconstructor, are
+turned into per-exception statistics: number of activations, total and
+entry-to-exit time, deepest nesting and a histogram of durations.
+
+    python -m cmdebug.irqstats capture.bin --clk 72e6 --svd device.svd
+
+===============================================================================
+
+This file is part of PyCortexMDebug
+
+PyCortexMDebug is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCortexMDebug is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import sys
+
+from collections import Counter
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from cmdebug.itm import EXC_ENTERED, EXC_EXITED, EXC_RETURNED, ExceptionTrace, Overflow, Packet, decode_stream
+from cmdebug.stats import RunningStats
+from cmdebug.trace import TS_PRESCALERS, TimestampReconstructor, exception_name
+
+
+class ExceptionStats:
+    """
+    Statistics of one exception number
+
+    Durations are measured from entry to exit in timestamp ticks and include
+    the time spent in higher priority exceptions that preempted this one.
+    """
+
+    __slots__ = ("number", "count", "max_nesting", "durations", "histogram")
+
+    def __init__(self, number: int) -> None:
+        self.number = number
+        # Entries, durations only count the activations whose exit was seen too
+        self.count = 0
+        # Deepest exception nesting seen when this exception was entered, 1 means it preempted thread mode
+        self.max_nesting = 0
+        self.durations = RunningStats((0.5, 0.99))
+        # Power of two duration buckets: bucket n holds durations in [2^(n-1), 2^n)
+        self.histogram = Counter()
+
+    @property
+    def total(self) -> int:
+        return self.durations.total
+
+    def add(self, duration: int) -> None:
+        self.durations.add(duration)
+        self.histogram[duration.bit_length()] += 1
+
+
+class IRQStats:
+    """
+    Per-exception statistics from a stream of timed packets
+
+    Exits are matched to the innermost active entry of the same exception.
+    Trace overflows and returns to thread mode end all active exceptions
+    without recording their durations, since some packets were lost.
+    """
+
+    def __init__(self) -> None:
+        self.exceptions = {}
+        self.stack = []
+        self.max_nesting = 0
+        self.overflows = 0
+        self.unmatched = 0
+        # Time with at least one exception active
+        self.busy = 0
+        self.busy_since = None
+        self.first = None
+        self.last = None
+
+    def _stats(self, number: int) -> ExceptionStats:
+        stats = self.exceptions.get(number)
+        if stats is None:
+            stats = self.exceptions[number] = ExceptionStats(number)
+        return stats
+
+    def add(self, ticks: int, packet: Packet) -> None:
+        """
+        Add one packet with its time in timestamp ticks, anything but exception trace is ignored
+        """
+        kind = type(packet)
+        if kind is Overflow:
+            self.overflows += 1
+            self._unwind(ticks, 0)
+            return
+        if kind is not ExceptionTrace:
+            return
+        if self.first is None:
+            self.first = ticks
+        self.last = ticks
+
+        number = packet.number
+        if packet.function == EXC_ENTERED:
+            if not self.stack:
+                self.busy_since = ticks
+            self.stack.append((number, ticks))
+            stats = self._stats(number)
+            stats.count += 1
+            depth = len(self.stack)
+            if depth > stats.max_nesting:
+                stats.max_nesting = depth
+            if depth > self.max_nesting:
+                self.max_nesting = depth
+        elif packet.function == EXC_EXITED:
+            for i in range(len(self.stack) - 1, -1, -1):
+                if self.stack[i][0] == number:
+                    self._stats(number).add(ticks - self.stack[i][1])
+                    # Anything above it lost its exit packet
+                    self._unwind(ticks, i)
+                    break
+            else:
+                # The trace started inside this handler
+                self.unmatched += 1
+        elif packet.function == EXC_RETURNED and number == 0:
+            self._unwind(ticks, 0)
+
+    def _unwind(self, ticks: int, depth: int) -> None:
+        del self.stack[depth:]
+        if not self.stack and self.busy_since is not None:
+            self.busy += ticks - self.busy_since
+            self.busy_since = None
+
+    def feed(self, timed: Iterable[Tuple[int, Packet]]) -> "IRQStats":
+        for ticks, packet in timed:
+            self.add(ticks, packet)
+        return self
+
+    def report(self, clk: Optional[float] = None, names: Optional[Callable[[int], Optional[str]]] = None,
+               histograms: bool = True) -> List[str]:
+        """
+        Format the statistics as text lines, busiest exception first
+
+        Args:
+            clk: Timestamp clock in Hz, times are in timestamp clock cycles without it
+            names: Function giving the name of an exception number, or None to use the default name
+            histograms: Include the duration histogram of each exception
+        """
+        scale = 1.0 / clk if clk else 1
+
+        def fmt(ticks):
+            if ticks is None:
+                return "-"
+            return "{:.3g}us".format(ticks * scale * 1e6) if clk else "{:.0f}".format(ticks * scale)
+
+        lines = ["{:24} {:>9} {:>10} {:>10} {:>10} {:>10} {:>10} {:>5}".format(
+            "exception", "count", "total", "min", "mean", "p99", "max", "nest")]
+        span = (self.last - self.first) if self.first is not None else 0
+        for stats in sorted(self.exceptions.values(), key=lambda e: e.total, reverse=True):
+            name = (names(stats.number) if names else None) or exception_name(stats.number)
+            d = stats.durations
+            lines.append("{:24} {:>9} {:>10} {:>10} {:>10} {:>10} {:>10} {:>5}".format(
+                "{} ({})".format(name, stats.number)[:24], stats.count, fmt(stats.total),
+                fmt(d.minimum), fmt(d.mean), fmt(d.quantile(0.99)), fmt(d.maximum), stats.max_nesting))
+            if histograms and stats.histogram:
+                peak = max(stats.histogram.values())
+                for bucket in range(min(stats.histogram), max(stats.histogram) + 1):
+                    n = stats.histogram.get(bucket, 0)
+                    low = 0 if bucket == 0 else 1 << (bucket - 1)
+                    bar = "#" * max(n * 40 // peak, 1 if n else 0)
+                    lines.append("    >= {:>10} {:>9} {}".format(fmt(low), n, bar))
+        if span:
+            lines.append("trace span {}, {:.1f}% in exceptions, max nesting {}".format(
+                fmt(span), 100.0 * self.busy / span, self.max_nesting))
+        if self.overflows or self.unmatched:
+            lines.append("{} overflows, {} exits without entry".format(self.overflows, self.unmatched))
+        return lines
+
+
+def irq_stats(packets: Iterable[Packet], prescaler: int = 1) -> IRQStats:
+    """
+    Collect interrupt statistics from a decoded packet stream
+
+    Args:
+        packets: Decoded ITM/DWT packets
+        prescaler: ITM timestamp prescaler of the local timestamps
+    """
+    timestamps = TimestampReconstructor(prescaler)
+    stats = IRQStats().feed(timestamps.feed(packets))
+    return stats.feed(timestamps.flush())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Interrupt statistics from a DWT exception trace capture")
+    parser.add_argument("capture", help="Capture file, - for stdin")
+    parser.add_argument("--clk", type=float, help="Timestamp clock in Hz (default: show ticks)")
+    parser.add_argument("--prescaler", type=int, default=1, choices=TS_PRESCALERS, help="ITM timestamp prescaler")
+    parser.add_argument("--svd", help="SVD file to take the interrupt names from")
+    parser.add_argument("--no-histograms", action="store_true", help="Only show the summary table")
+    args = parser.parse_args(argv)
+
+    names = None
+    if args.svd:
+        from cmdebug.svd_cache import load_svd_file
+        names = load_svd_file(args.svd).exception_name
+
+    f = sys.stdin.buffer if args.capture == "-" else open(args.capture, "rb")
+    try:
+        stats = irq_stats(decode_stream(f), args.prescaler)
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+    for line in stats.report(args.clk, names, not args.no_histograms):
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Streaming decoder for the ITM/DWT trace packet protocol (ARMv7-M ARM, appendix D4)
+
+The decoder is fed chunks of the raw byte stream, for example SWO output
+captured to a file, and yields one packet object per decoded packet. Packets
+may be split across chunk boundaries at any point, so captures of any size can
+be processed in fixed memory:
+
+    python -m cmdebug.itm capture.bin
+
+===============================================================================
+
+This file is part of PyCortexMDebug
+
+PyCortexMDebug is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCortexMDebug is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import sys
+
+from collections import Counter
+from typing import BinaryIO, Generator, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+# Longest packet that can be split across chunks: a GTS2 header with 6 payload bytes
+MAX_PACKET = 7
+
+# A synchronization packet is at least 47 zero bits followed by a one, i.e. 5 zero bytes and 0x80
+SYNC_ZEROS = 5
+
+# Hardware source packet discriminators
+HW_EVENT_COUNTER = 0
+HW_EXCEPTION_TRACE = 1
+HW_PC_SAMPLE = 2
+
+# Exception trace function codes
+EXC_ENTERED = 1
+EXC_EXITED = 2
+EXC_RETURNED = 3
+
+EXC_FUNCTIONS = {EXC_ENTERED: "entered", EXC_EXITED: "exited", EXC_RETURNED: "returned"}
+
+
+class Sync(NamedTuple):
+    pass
+
+
+class Overflow(NamedTuple):
+    pass
+
+
+class Stimulus(NamedTuple):
+    """ Software source packet written to an ITM stimulus port """
+    port: int
+    value: int
+    size: int
+
+
+class LocalTimestamp(NamedTuple):
+    """
+    Timestamp relative to the previous local timestamp
+
+    tc is the timing relationship: 0 when the timestamp is synchronous to the
+    preceding packet, 1 when the timestamp is delayed, 2 when the packet was
+    delayed and 3 when both were.
+    """
+    delta: int
+    tc: int
+
+
+class GlobalTimestamp1(NamedTuple):
+    """ Low bits [25:0] of the global timestamp, only the lowest `bits` bits of value are valid """
+    value: int
+    bits: int
+    wrap: bool
+    clkch: bool
+
+
+class GlobalTimestamp2(NamedTuple):
+    """ High bits [63:26] of the global timestamp, value is already shifted into place """
+    value: int
+
+
+class Extension(NamedTuple):
+    """ Extension packet, for the ITM this carries the stimulus port page """
+    value: int
+    hardware: bool
+
+
+class EventCounter(NamedTuple):
+    """ One of the DWT profiling counters wrapped, flags has a bit per counter """
+    flags: int
+
+
+class ExceptionTrace(NamedTuple):
+    """ Exception entry, exit or return, function is one of the EXC_* codes """
+    number: int
+    function: int
+
+
+class PCSample(NamedTuple):
+    """ Periodic PC sample, pc is None when the core was sleeping """
+    pc: Optional[int]
+
+
+class DataTrace(NamedTuple):
+    """ DWT data trace packet (comparator match, PC/address value or data value) """
+    discriminator: int
+    value: int
+    size: int
+
+
+class Unknown(NamedTuple):
+    """ Reserved or malformed header, skipped """
+    header: int
+
+
+Packet = Union[Sync, Overflow, Stimulus, LocalTimestamp, GlobalTimestamp1, GlobalTimestamp2, Extension,
+               EventCounter, ExceptionTrace, PCSample, DataTrace, Unknown]
+
+_SYNC = Sync()
+_OVERFLOW = Overflow()
+_SOURCE_SIZES = (0, 1, 2, 4)
+
+# Packets are immutable, so the byte sized stimulus packets are shared rather than built every time
+_STIMULUS8 = [Stimulus(port, value, 1) for port in range(32) for value in range(256)]
+
+
+def _continuation(buf, i: int, n: int, max_payload: int) -> int:
+    """
+    Length of the continuation payload after the header at i
+
+    Returns:
+        The number of payload bytes, -1 if the packet is incomplete or -2 if it is longer than max_payload
+    """
+    j = i + 1
+    end = i + 1 + max_payload
+    while j < n and j < end:
+        if not buf[j] & 0x80:
+            return j - i
+        j += 1
+    return -1 if j >= n and j < end else -2
+
+
+def _payload7(buf, start: int, count: int) -> int:
+    value = 0
+    for k in range(count):
+        value |= (buf[start + k] & 0x7F) << (7 * k)
+    return value
+
+
+class ITMDecoder:
+    """
+    Incremental ITM/DWT packet decoder
+
+    Feed it consecutive chunks of the stream; only an incomplete packet at the
+    end of a chunk (at most MAX_PACKET - 1 bytes) is copied and kept between calls.
+    """
+
+    def __init__(self) -> None:
+        self._pending = b""
+        self._zeros = 0
+        self.offset = 0
+
+    def feed(self, data: Union[bytes, bytearray, memoryview]) -> Generator[Packet, None, None]:
+        """
+        Decode a chunk of the stream
+
+        The chunk is not referenced after the generator is exhausted, so the
+        caller can reuse its buffer for the next read.
+
+        Args:
+            data: Next bytes of the stream
+        """
+        buf = memoryview(data).cast("B") if not isinstance(data, bytes) else data
+        n = len(buf)
+        start = 0
+        if self._pending:
+            # Complete the split packet from a small copy of the head of this chunk
+            pending = self._pending
+            head = pending + bytes(buf[:MAX_PACKET])
+            packets, pos = self._decode(head, 0, len(head))
+            yield from packets
+            if pos < len(pending):
+                # Still incomplete, the whole chunk fit into head
+                self._pending = head[pos:]
+                self.offset += n
+                return
+            self._pending = b""
+            start = pos - len(pending)
+        packets, pos = self._decode(buf, start, n)
+        yield from packets
+        self._pending = bytes(buf[pos:n])
+        self.offset += n
+
+    def _decode(self, buf, i: int, n: int) -> Tuple[List[Packet], int]:
+        """
+        Decode all complete packets in buf[i:n]
+
+        Returns:
+            The decoded packets and the position of the first byte that was not consumed
+        """
+        packets = []
+        emit = packets.append
+        zeros = self._zeros
+        while i < n:
+            h = buf[i]
+            if h == 0:
+                zeros += 1
+                i += 1
+                continue
+
+            size = h & 3
+            if size == 1 and not h & 4:
+                # Byte writes to a stimulus port (printf style output) dominate most captures
+                if i + 1 >= n:
+                    break
+                emit(_STIMULUS8[((h >> 3) << 8) | buf[i + 1]])
+                i += 2
+                zeros = 0
+                continue
+            if size:
+                # Source packet
+                length = _SOURCE_SIZES[size]
+                if i + 1 + length > n:
+                    break
+                value = buf[i + 1]
+                if length > 1:
+                    value |= buf[i + 2] << 8
+                    if length > 2:
+                        value |= (buf[i + 3] << 16) | (buf[i + 4] << 24)
+                if h & 4:
+                    emit(self._hardware(h >> 3, value, length))
+                else:
+                    emit(Stimulus(h >> 3, value, length))
+                i += 1 + length
+                zeros = 0
+                continue
+
+            if h == 0x80 and zeros >= SYNC_ZEROS:
+                zeros = 0
+                i += 1
+                emit(_SYNC)
+                continue
+            zeros = 0
+
+            if h == 0x70:
+                i += 1
+                emit(_OVERFLOW)
+            elif not h & 0x0F:
+                if not h & 0x80:
+                    # Local timestamp format 2, the delta is in the header
+                    i += 1
+                    emit(LocalTimestamp(h >> 4, 0))
+                elif h & 0x40:
+                    # Local timestamp format 1
+                    count = _continuation(buf, i, n, 4)
+                    if count == -1:
+                        break
+                    if count == -2:
+                        i += 1
+                        emit(Unknown(h))
+                        continue
+                    delta = _payload7(buf, i + 1, count)
+                    i += 1 + count
+                    emit(LocalTimestamp(delta, (h >> 4) & 3))
+                else:
+                    i += 1
+                    emit(Unknown(h))
+            elif h & 0x0B == 0x08:
+                # Extension, the header carries the 3 low bits
+                if h & 0x80:
+                    count = _continuation(buf, i, n, 4)
+                    if count == -1:
+                        break
+                    if count == -2:
+                        i += 1
+                        emit(Unknown(h))
+                        continue
+                    value = ((h >> 4) & 7) | (_payload7(buf, i + 1, count) << 3)
+                    i += 1 + count
+                else:
+                    value = (h >> 4) & 7
+                    i += 1
+                emit(Extension(value, bool(h & 4)))
+            elif h == 0x94 or h == 0xB4:
+                count = _continuation(buf, i, n, 4 if h == 0x94 else 6)
+                if count == -1:
+                    break
+                if count == -2:
+                    i += 1
+                    emit(Unknown(h))
+                    continue
+                if h == 0x94:
+                    if count == 4:
+                        last = buf[i + 4]
+                        value = _payload7(buf, i + 1, 3) | ((last & 0x1F) << 21)
+                        packet = GlobalTimestamp1(value, 26, bool(last & 0x40), bool(last & 0x20))
+                    else:
+                        packet = GlobalTimestamp1(_payload7(buf, i + 1, count), 7 * count, False, False)
+                else:
+                    packet = GlobalTimestamp2(_payload7(buf, i + 1, count) << 26)
+                i += 1 + count
+                emit(packet)
+            else:
+                i += 1
+                emit(Unknown(h))
+        self._zeros = zeros
+        return packets, i
+
+    @staticmethod
+    def _hardware(discriminator: int, value: int, size: int) -> Packet:
+        if discriminator == HW_EXCEPTION_TRACE:
+            return ExceptionTrace(value & 0x1FF, (value >> 12) & 3)
+        if discriminator == HW_PC_SAMPLE:
+            return PCSample(value if size == 4 else None)
+        if discriminator == HW_EVENT_COUNTER:
+            return EventCounter(value)
+        return DataTrace(discriminator, value, size)
+
+
+def decode_stream(f: BinaryIO, chunk_size: int = 1 << 20) -> Generator[Packet, None, None]:
+    """
+    Decode a whole file or pipe, reading it in chunks into a single reused buffer
+
+    Args:
+        f: Binary file object
+        chunk_size: Size of each read
+    """
+    decoder = ITMDecoder()
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    readinto = getattr(f, "readinto", None)
+    while True:
+        if readinto is not None:
+            n = readinto(buf)
+            if not n:
+                break
+            yield from decoder.feed(view[:n])
+        else:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            yield from decoder.feed(data)
+
+
+def decode_bytes(data: Union[bytes, bytearray, memoryview]) -> Iterable[Packet]:
+    return ITMDecoder().feed(data)
+
+
+def format_packet(packet: Packet) -> str:
+    if isinstance(packet, Stimulus):
+        return "stim {:2} {:#0{}x}".format(packet.port, packet.value, 2 + 2 * packet.size)
+    if isinstance(packet, ExceptionTrace):
+        return "exc  {} {}".format(packet.number, EXC_FUNCTIONS.get(packet.function, packet.function))
+    if isinstance(packet, PCSample):
+        return "pc   " + ("sleep" if packet.pc is None else "{:#010x}".format(packet.pc))
+    return repr(packet)
+
+
+def _packets(f: BinaryIO, tpiu_source: Optional[int]) -> Iterable[Packet]:
+    if tpiu_source is None:
+        return decode_stream(f)
+    from cmdebug.tpiu import source_stream
+    decoder = ITMDecoder()
+    return (packet for data in source_stream(f, tpiu_source) for packet in decoder.feed(data))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Decode an ITM/DWT trace capture")
+    parser.add_argument("file", help="Capture file, - for stdin")
+    parser.add_argument("--summary", action="store_true", help="Only count the packets of each type")
+    parser.add_argument("--port", type=int, action="append", help="Only show this stimulus port as text")
+    parser.add_argument("--tpiu", type=int, metavar="ID", help="Capture uses the TPIU formatter, ITM has this ID")
+    args = parser.parse_args(argv)
+
+    f = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+    try:
+        if args.summary:
+            counts = Counter(type(packet).__name__ for packet in _packets(f, args.tpiu))
+            for name, count in counts.most_common():
+                print("{:16} {}".format(name, count))
+        elif args.port:
+            ports = set(args.port)
+            out = sys.stdout.buffer
+            for packet in _packets(f, args.tpiu):
+                if type(packet) is Stimulus and packet.port in ports:
+                    out.write(packet.value.to_bytes(packet.size, "little"))
+        else:
+            for packet in _packets(f, args.tpiu):
+                print(format_packet(packet))
+    except BrokenPipeError:
+        pass
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
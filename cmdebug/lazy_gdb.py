@@ -0,0 +1,76 @@
+"""
+This file is part of PyCortexMDebug
+
+PyCortexMDebug is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCortexMDebug is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import gdb
+import importlib
+
+# Only gdb and the standard library may be imported here: this module is
+# loaded on every gdb start, the real commands only when they are used.
+
+
+class LazyCommand(gdb.Command):
+    """ Placeholder for a command whose implementation is only imported on first use
+
+    The first invocation or completion imports the module, creates the real
+    command (which replaces this one in gdb) and forwards the call to it.
+    """
+
+    def __init__(self, name, module, class_name, doc, command_class=gdb.COMMAND_DATA):
+        # gdb takes the help text from __doc__ when the command is registered
+        self.__doc__ = doc
+        gdb.Command.__init__(self, name, command_class)
+        self.module = module
+        self.class_name = class_name
+        self.impl = None
+
+    def load(self):
+        if self.impl is None:
+            cls = getattr(importlib.import_module(self.module), self.class_name)
+            self.impl = cls()
+        return self.impl
+
+    def invoke(self, args, from_tty):
+        return self.load().invoke(args, from_tty)
+
+    def complete(self, text, word):
+        return self.load().complete(text, word)
+
+
+class NoSVDLoaded(gdb.Command):
+    """ Stand-in for the svd command until an SVD file is loaded with svd_load
+    """
+
+    def __init__(self):
+        gdb.Command.__init__(self, "svd", gdb.COMMAND_DATA)
+
+    def invoke(self, args, from_tty):
+        raise gdb.GdbError("No SVD file loaded, use svd_load first\n")
+
+    def complete(self, text, word):
+        return gdb.COMPLETE_NONE
+
+
+def register_commands():
+    """ Register all commands, deferring the import of their implementations
+    """
+    LazyCommand("dwt", "cmdebug.dwt_gdb", "DWT",
+                "Configure and read the DWT cycle counter, PC sampling and exception trace")
+    LazyCommand("svd_load", "cmdebug.svd_gdb", "LoadSVD",
+                "A command to load an SVD file and to create the command for inspecting that object",
+                gdb.COMMAND_USER)
+    LazyCommand("swo", "cmdebug.swo_gdb", "SWO", "Show the ITM output of the target from a live SWO stream")
+    NoSVDLoaded()
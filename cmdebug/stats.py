@@ -0,0 +1,138 @@
+"""
+This file is part of PyCortexMDebug
+
+PyCortexMDebug is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCortexMDebug is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class P2Quantile:
+    """
+    Streaming estimate of a single quantile with the P-square algorithm
+
+    Keeps five markers regardless of how many values are added (Jain and
+    Chlamtac, "The P2 algorithm for dynamic calculation of quantiles and
+    histograms without storing observations", 1985).
+    """
+
+    __slots__ = ("p", "heights", "positions", "desired", "increments", "count")
+
+    def __init__(self, p: float) -> None:
+        """
+
+        Args:
+            p: Quantile to estimate, between 0 and 1
+        """
+        self.p = p
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+        self.count = 0
+
+    def add(self, x: float) -> None:
+        self.count += 1
+        q = self.heights
+        if len(q) < 5:
+            bisect.insort(q, x)
+            return
+
+        n = self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Move the middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                h = self._parabolic(i, d)
+                if not q[i - 1] < h < q[i + 1]:
+                    h = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = h
+                n[i] += d
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q = self.heights
+        n = self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self) -> Optional[float]:
+        """
+        Current estimate, exact while fewer than five values have been added
+        """
+        if not self.heights:
+            return None
+        if self.count <= 5:
+            return self.heights[min(len(self.heights) - 1, int(round(self.p * (len(self.heights) - 1))))]
+        return self.heights[2]
+
+
+class RunningStats:
+    """
+    Count, total, min, max, mean and streaming quantile estimates of a series of values
+    """
+
+    count: int
+    total: float
+    minimum: Optional[float]
+    maximum: Optional[float]
+    quantiles: Dict[float, P2Quantile]
+
+    def __init__(self, quantiles: Iterable[float] = (0.5, 0.99)) -> None:
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+        self.quantiles = {p: P2Quantile(p) for p in quantiles}
+
+    def add(self, x: float) -> None:
+        self.count += 1
+        self.total += x
+        if self.minimum is None or x < self.minimum:
+            self.minimum = x
+        if self.maximum is None or x > self.maximum:
+            self.maximum = x
+        for q in self.quantiles.values():
+            q.add(x)
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def quantile(self, p: float) -> Optional[float]:
+        return self.quantiles[p].value()
+
+    def summary(self) -> List[Tuple[str, Optional[float]]]:
+        """
+        (label, value) pairs for reporting
+        """
+        rows = [("count", self.count), ("min", self.minimum), ("max", self.maximum), ("mean", self.mean)]
+        rows.extend(("p{:g}".format(p * 100), q.value()) for p, q in self.quantiles.items())
+        return rows
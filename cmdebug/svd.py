@@ -16,47 +16,114 @@ You should have received a copy of the GNU General Public License
 along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import lxml.objectify as objectify
+import lxml.etree as etree
 import sys
-from collections import OrderedDict
+import bisect
 import os
-import pickle
+import copy
 import traceback
 import re
+import threading
 import warnings
 
-from typing import Dict, Tuple, Any, Iterable, Union
+from typing import Callable, Dict, List, NamedTuple, Tuple, Any, Iterable, Optional, Union
+
+
+NUMERIC_SUFFIX_RE = re.compile(r'^(.*?)([0-9]*)$')
+
+# Where messages about the SVD file being parsed go, set per thread by SVDFile
+_log = threading.local()
+
+
+def _message(text: str, warning: bool = False) -> None:
+    """
+    Report a problem found while parsing, to the log callback of the SVDFile being built if any
+
+    Args:
+        text: The message
+        warning: Issue it with warnings.warn rather than print when there is no callback
+    """
+    callback = getattr(_log, "callback", None)
+    if callback is not None:
+        callback(text)
+    elif warning:
+        warnings.warn(text, stacklevel=3)
+    else:
+        print(text)
 
 
 class SmartDict:
     """
     Dictionary for search by case-insensitive lookup and/or prefix lookup
+
+    Prefix queries go through a sorted index of the lower-cased keys, which is
+    built on the first query and kept up to date by later inserts.
     """
 
-    od: OrderedDict
+    __slots__ = ("od", "casemap", "_index", "_rank")
+
+    od: Dict[str, Any]
     casemap: Dict[str, Any]
+    _index: Optional[List[str]]
+    _rank: Optional[Dict[str, int]]
 
     def __init__(self) -> None:
-        self.od = OrderedDict()
+        # dicts keep insertion order and are half the size of an OrderedDict
+        self.od = {}
         self.casemap = {}
+        self._index = None
+        self._rank = None
 
-    def __getitem__(self, key: str) -> Any:
-        if key in self.od:
-            return self.od[key]
+    def lookup(self, key: str) -> Tuple[Optional[str], List[str]]:
+        """
+        Resolve a key by exact, case-insensitive or prefix match in a single pass
 
-        if key.lower() in self.casemap:
-            return self.od[self.casemap[key.lower()]]
+        Returns:
+            A (od_key, candidates) pair: od_key is the matching key or None, and
+            candidates lists every prefix match when the key is ambiguous.
+        """
+        if key in self.od:
+            return key, []
+        lower = key.lower()
+        if lower in self.casemap:
+            return self.casemap[lower], []
+        matches = self._prefix_matches(lower)
+        if not matches:
+            return None, []
+        return matches[0], matches if len(matches) > 1 else []
 
-        return self.od[self.prefix_match(key)]
+    def __getitem__(self, key: str) -> Any:
+        od_key, _ = self.lookup(key)
+        if od_key is None:
+            raise KeyError(key)
+        return self.od[od_key]
 
     def is_ambiguous(self, key: str) -> bool:
-        return key not in self.od and key not in self.casemap and len(list(self.prefix_match_iter(key))) > 1
+        return len(self.lookup(key)[1]) > 1
+
+    def _prefix_matches(self, lower: str) -> List[str]:
+        """
+        Keys starting with the name part of a lower-cased key and ending with its numeric suffix
+
+        A key like "tim1" matches any entry that starts with "tim" and ends with
+        "1". Matches are returned in insertion order.
+        """
+        if self._index is None:
+            self._index = sorted(self.casemap)
+            self._rank = {k: i for i, k in enumerate(self.casemap)}
+        name, number = NUMERIC_SUFFIX_RE.match(lower).groups()
+        index = self._index
+        matches = []
+        i = bisect.bisect_left(index, name)
+        while i < len(index) and index[i].startswith(name):
+            if index[i].endswith(number):
+                matches.append(index[i])
+            i += 1
+        matches.sort(key=self._rank.__getitem__)
+        return [self.casemap[m] for m in matches]
 
     def prefix_match_iter(self, key: str) -> Any:
-        name, number = re.match(r'^(.*?)([0-9]*)$', key.lower()).groups()
-        for entry, od_key in self.casemap.items():
-            if entry.startswith(name) and entry.endswith(number):
-                yield od_key
+        return iter(self._prefix_matches(key.lower()))
 
     def prefix_match(self, key: str) -> Any:
         for od_key in self.prefix_match_iter(key):
@@ -65,20 +132,27 @@ class SmartDict:
 
     def __setitem__(self, key: str, value: Any) -> None:
         if key in self.od:
-            warnings.warn(f'Duplicate entry {key}')
+            _message(f'Duplicate entry {key}', warning=True)
         elif key.lower() in self.casemap:
-            warnings.warn(f'Entry {key} differs from duplicate {self.casemap[key.lower()]} only in cAsE')
+            _message(f'Entry {key} differs from duplicate {self.casemap[key.lower()]} only in cAsE', warning=True)
 
-        self.casemap[key.lower()] = key
+        lower = key.lower()
+        if self._index is not None and lower not in self.casemap:
+            bisect.insort(self._index, lower)
+            self._rank[lower] = len(self._rank)
+        self.casemap[lower] = key
         self.od[key] = value
 
     def __delitem__(self, key: str) -> None:
-        if self.casemap[key.lower()] == key:  # Check that we did not overwrite this entry
-            del self.casemap[key.lower()]
+        lower = key.lower()
+        if self.casemap[lower] == key:  # Check that we did not overwrite this entry
+            del self.casemap[lower]
         del self.od[key]
+        # Deletes are rare, just rebuild the index on the next prefix query
+        self._index = None
 
     def __contains__(self, key: str) -> bool:
-        return key in self.od or key.lower() in self.casemap or self.prefix_match(key)
+        return self.lookup(key)[0] is not None
 
     def __iter__(self) -> Iterable[Any]:
         return iter(self.od)
@@ -114,36 +188,234 @@ class SVDNonFatalError(Exception):
         return s
 
 
+def _text(elem, tag: str, default: Any = None) -> Any:
+    """
+    Get the stripped text of a direct child element
+
+    Args:
+        elem: XML element to look in
+        tag: Tag of the child element
+        default: Value returned if the child does not exist
+    """
+    child = elem.find(tag)
+    if child is None:
+        return default
+    # Names, access types and descriptions repeat a lot within an SVD file,
+    # interning makes all of the model objects share one copy of each
+    return sys.intern((child.text or "").strip())
+
+
+def _int(elem, tag: str, default: Any = None) -> Any:
+    """
+    Get the integer value of a direct child element, in any python int literal format
+    """
+    text = _text(elem, tag)
+    if text is None:
+        return default
+    return int(text, 0)
+
+
+READABLE_ACCESS = frozenset(("read-only", "read-write", "read-writeOnce"))
+WRITABLE_ACCESS = frozenset(("write-only", "read-write", "writeOnce", "read-writeOnce"))
+
+class _NoEnum(dict):
+    """
+    Empty enum table shared by all fields without enumerated values
+    """
+
+    __slots__ = ()
+
+    def __setitem__(self, key: int, value: Tuple[str, str]) -> None:
+        raise TypeError("NO_ENUM is shared and must not be modified")
+
+    def __reduce__(self) -> str:
+        # Unpickle as the module-level singleton
+        return "NO_ENUM"
+
+
+NO_ENUM = _NoEnum()
+
+
+class AddressMatch(NamedTuple):
+    """
+    Result of an address lookup in an SVDFile
+    """
+
+    peripheral: "SVDPeripheral"
+    cluster: Optional["SVDRegisterCluster"]
+    register: "SVDPeripheralRegister"
+    # Byte offset of the address within the register
+    offset: int
+    # Fields with at least one bit in the addressed byte
+    fields: List["SVDPeripheralRegisterField"]
+
+
+# Exception number of IRQ 0, the first external interrupt
+IRQ_EXCEPTION_BASE = 16
+
+
+class SVDInterrupt(NamedTuple):
+    """
+    An <interrupt> of a peripheral
+    """
+
+    name: str
+    description: str
+    # IRQ number, the exception number is this plus IRQ_EXCEPTION_BASE
+    value: int
+    # Name of the peripheral that defines it
+    peripheral: str
+
+
 class SVDFile:
     """
     A parsed SVD file
     """
 
     peripherals: SmartDict
+    # Indexed by IRQ number, None where the device has no interrupt
+    interrupts: List[Optional[SVDInterrupt]]
+    interrupt_names: SmartDict
     base_address: int
 
-    def __init__(self, fname: str) -> None:
+    def __init__(self, fname: str, lazy: bool = False, log: Optional[Callable[[str], None]] = None) -> None:
         """
+        The file is parsed as a stream: each <peripheral> is turned into an
+        SVDPeripheral as soon as its closing tag is seen and its XML subtree is
+        then discarded, so only one peripheral is ever held in memory as XML.
 
         Args:
             fname: Filename for the SVD file
+            lazy: Only parse the peripheral headers now and build each
+                peripheral's registers and clusters on first access
+            log: Called with each message about problems in the file instead
+                of printing it, for parsing outside of the main thread
         """
-        f = objectify.parse(os.path.expanduser(fname))
-        root = f.getroot()
-        periph = root.peripherals.getchildren()
         self.peripherals = SmartDict()
+        self.interrupts = []
+        self.interrupt_names = SmartDict()
         self.base_address = 0
+        self._address_starts = None
+        self._address_entries = None
+        self._max_register_bytes = 0
 
-        # XML elements
-        for p in periph:
+        previous = getattr(_log, "callback", None)
+        _log.callback = log
+        try:
+            self._parse(fname, lazy)
+        finally:
+            _log.callback = previous
+
+    def _parse(self, fname: str, lazy: bool) -> None:
+        for _, p in etree.iterparse(os.path.expanduser(fname), events=("end",), tag="peripheral"):
             try:
-                if p.tag == "peripheral":
-                    self.peripherals[str(p.name)] = SVDPeripheral(p, self)
-                else:
-                    # This is some other tag
-                    pass
+                self.peripherals[_text(p, "name")] = SVDPeripheral(p, self, lazy)
             except SVDNonFatalError as e:
-                print(e)
+                _message(str(e))
+            self._add_interrupts(p)
+
+            # Free the processed subtree along with any preceding siblings
+            p.clear()
+            while p.getprevious() is not None:
+                del p.getparent()[0]
+
+    def _add_interrupts(self, svd_elem) -> None:
+        """
+        Record the <interrupt> elements of a peripheral
+
+        Args:
+            svd_elem: XML element for the peripheral
+        """
+        for node in svd_elem.iterfind("interrupt"):
+            value = _int(node, "value")
+            name = _text(node, "name")
+            if value is None or value < 0:
+                continue
+            if not name:
+                _message(f"Interrupt {value} of {_text(svd_elem, 'name')} has no name")
+                continue
+            if value >= len(self.interrupts):
+                self.interrupts.extend([None] * (value + 1 - len(self.interrupts)))
+            elif self.interrupts[value] is not None:
+                # Several instances often share one vector, keep the first
+                continue
+            interrupt = SVDInterrupt(name, _text(node, "description", ""), value,
+                                     _text(svd_elem, "name"))
+            self.interrupts[value] = interrupt
+            if interrupt.name.lower() not in self.interrupt_names.casemap:
+                self.interrupt_names[interrupt.name] = interrupt
+
+    def interrupt(self, irq: int) -> Optional[SVDInterrupt]:
+        """
+        Get an interrupt by IRQ number
+
+        Args:
+            irq: IRQ number, as in NVIC registers (exception number - 16)
+
+        Returns:
+            The interrupt, or None if the device has no interrupt with that number
+        """
+        if 0 <= irq < len(self.interrupts):
+            return self.interrupts[irq]
+        return None
+
+    def exception_name(self, number: int) -> Optional[str]:
+        """
+        Name of the interrupt behind an exception number
+
+        Args:
+            number: Exception number as seen in IPSR or in exception trace
+
+        Returns:
+            The interrupt name, or None if the number is not an interrupt of this device
+        """
+        interrupt = self.interrupt(number - IRQ_EXCEPTION_BASE)
+        return None if interrupt is None else interrupt.name
+
+    def _build_address_index(self) -> None:
+        """
+        Build the sorted index of register address ranges used by lookup_address
+        """
+        entries = []
+        for p in self.peripherals.values():
+            for r in p.registers.values():
+                entries.append((r.address(), p, None, r))
+            for c in p.clusters.values():
+                for r in c.registers.values():
+                    entries.append((r.address(), p, c, r))
+        entries.sort(key=lambda e: e[0])
+        self._max_register_bytes = max((max(1, e[3].size // 8) for e in entries), default=1)
+        self._address_starts = [e[0] for e in entries]
+        self._address_entries = entries
+
+    def lookup_address(self, address: int) -> Optional[AddressMatch]:
+        """
+        Find the register containing an address
+
+        The index over all registers is built on the first call, so each lookup
+        is a binary search.
+
+        Args:
+            address: Absolute address to look up
+
+        Returns:
+            The matching AddressMatch, or None if no register covers the address
+        """
+        if self._address_starts is None:
+            self._build_address_index()
+
+        # Registers can overlap (e.g. alternate groups), so look back over
+        # every register that starts close enough to still cover the address
+        i = bisect.bisect_right(self._address_starts, address) - 1
+        while i >= 0 and self._address_starts[i] > address - self._max_register_bytes:
+            start, peripheral, cluster, register = self._address_entries[i]
+            offset = address - start
+            if offset < max(1, register.size // 8):
+                byte_mask = 0xFF << (offset * 8)
+                fields = [f for f in register.fields.values() if f.mask & byte_mask]
+                return AddressMatch(peripheral, cluster, register, offset, fields)
+            i -= 1
+        return None
 
 
 def add_register(parent: Union["SVDPeripheral", "SVDRegisterCluster"], node):
@@ -155,16 +427,16 @@ def add_register(parent: Union["SVDPeripheral", "SVDRegisterCluster"], node):
         node: XML file node fot of the register
     """
 
-    if hasattr(node, "dim"):
-        dim = int(str(node.dim), 0)
+    if node.find("dim") is not None:
+        dim = _int(node, "dim")
         # dimension is not used, number of split indexes should be same
-        incr = int(str(node.dimIncrement), 0)
+        incr = _int(node, "dimIncrement")
         default_dim_index = ",".join((str(i) for i in range(dim)))
-        dim_index = str(getattr(node, "dimIndex", default_dim_index))
+        dim_index = _text(node, "dimIndex", default_dim_index)
         indices = dim_index.split(',')
         offset = 0
         for i in indices:
-            name = str(node.name) % i
+            name = _text(node, "name") % i
             reg = SVDPeripheralRegister(node, parent)
             reg.name = name
             reg.offset += offset
@@ -173,30 +445,31 @@ def add_register(parent: Union["SVDPeripheral", "SVDRegisterCluster"], node):
     else:
         try:
             reg = SVDPeripheralRegister(node, parent)
-            name = str(node.name)
-            if name not in parent.registers:
+            name = _text(node, "name")
+            # Exact duplicate check, a prefix match would also hit e.g. CR1 for CR
+            if name.lower() not in parent.registers.casemap:
                 parent.registers[name] = reg
             else:
-                if hasattr(node, "alternateGroup"):
-                    print(f"Register {name} has an alternate group")
+                if node.find("alternateGroup") is not None:
+                    _message(f"Register {name} has an alternate group")
         except SVDNonFatalError as e:
-            print(e)
+            _message(str(e))
 
 
 def add_cluster(parent: "SVDPeripheral", node) -> None:
     """
     Add a register cluster to a peripheral
     """
-    if hasattr(node, "dim"):
-        dim = int(str(node.dim), 0)
+    if node.find("dim") is not None:
+        dim = _int(node, "dim")
         # dimension is not used, number of split indices should be same
-        incr = int(str(node.dimIncrement), 0)
+        incr = _int(node, "dimIncrement")
         default_dim_index = ",".join((str(i) for i in range(dim)))
-        dim_index = str(getattr(node, "dimIndex", default_dim_index))
+        dim_index = _text(node, "dimIndex", default_dim_index)
         indices = dim_index.split(',')
         offset = 0
         for i in indices:
-            name = str(node.name) % i
+            name = _text(node, "name") % i
             cluster = SVDRegisterCluster(node, parent)
             cluster.name = name
             cluster.address_offset += offset
@@ -205,9 +478,9 @@ def add_cluster(parent: "SVDPeripheral", node) -> None:
             offset += incr
     else:
         try:
-            parent.clusters[str(node.name)] = SVDRegisterCluster(node, parent)
+            parent.clusters[_text(node, "name")] = SVDRegisterCluster(node, parent)
         except SVDNonFatalError as e:
-            print(e)
+            _message(str(e))
 
 
 class SVDRegisterCluster:
@@ -215,6 +488,9 @@ class SVDRegisterCluster:
     Register cluster
     """
 
+    __slots__ = ("parent_base_address", "parent_name", "address_offset", "base_address", "description", "name",
+                 "registers", "clusters")
+
     parent_base_address: int
     parent_name: str
     address_offset: int
@@ -233,17 +509,15 @@ class SVDRegisterCluster:
         """
         self.parent_base_address = parent.base_address
         self.parent_name = parent.name
-        self.address_offset = int(str(svd_elem.addressOffset), 0)
+        self.address_offset = _int(svd_elem, "addressOffset")
         self.base_address = self.address_offset + self.parent_base_address
         # This doesn't inherit registers from anything
-        children = svd_elem.getchildren()
-        self.description = str(getattr(svd_elem, "description", ""))
-        self.name = str(svd_elem.name)
+        self.description = _text(svd_elem, "description", "")
+        self.name = _text(svd_elem, "name")
         self.registers = SmartDict()
         self.clusters = SmartDict()
-        for r in children:
-            if r.tag == "register":
-                add_register(self, r)
+        for r in svd_elem.iterchildren("register"):
+            add_register(self, r)
 
     def refactor_parent(self, parent: "SVDPeripheral"):
         self.parent_base_address = parent.base_address
@@ -253,6 +527,20 @@ class SVDRegisterCluster:
         for r in values:
             r.refactor_parent(self)
 
+    def derive(self, parent: "SVDPeripheral") -> "SVDRegisterCluster":
+        """
+        Create a copy of this cluster for a derived peripheral, sharing the register layouts
+
+        Args:
+            parent: The derived SVDPeripheral object
+        """
+        cluster = copy.copy(self)
+        cluster.registers = SmartDict()
+        cluster.refactor_parent(parent)
+        for name, r in self.registers.items():
+            cluster.registers[name] = r.derive(cluster)
+        return cluster
+
     def __str__(self):
         return str(self.name)
 
@@ -264,49 +552,84 @@ class SVDPeripheral:
     parent_base_address: int
     name: str
     description: str
+    source_line: Optional[int]
 
-    def __init__(self, svd_elem, parent: SVDFile) -> None:
+    def __init__(self, svd_elem, parent: SVDFile, lazy: bool = False) -> None:
         """
 
         Args:
             svd_elem: XML element for the peripheral
             parent: Parent SVDFile object
+            lazy: Keep the XML for the registers and clusters and only build
+                them when they are first accessed
         """
         self.parent_base_address = parent.base_address
+        self.source_line = svd_elem.sourceline
+        self._svd_file = parent
+        self._registers = None
+        self._clusters = None
+        self._source = None
 
         # Look for a base address, as it is required
-        if not hasattr(svd_elem, "baseAddress"):
+        if svd_elem.find("baseAddress") is None:
             raise SVDNonFatalError(f"Periph without base address")
-        self.base_address = int(str(svd_elem.baseAddress), 0)
-        if 'derivedFrom' in svd_elem.attrib:
-            derived_from = svd_elem.attrib['derivedFrom']
-            try:
-                self.name = str(svd_elem.name)
-            except AttributeError:
-                self.name = parent.peripherals[derived_from].name
-            try:
-                self.description = str(svd_elem.description)
-            except AttributeError:
-                self.description = parent.peripherals[derived_from].description
-
-            # pickle is faster than deepcopy by up to 50% on svd files with a
-            # lot of derivedFrom definitions
-            def copier(a: Any) -> Any:
-                return pickle.loads(pickle.dumps(a))
-
-            self.registers = copier(parent.peripherals[derived_from].registers)
-            self.clusters = copier(parent.peripherals[derived_from].clusters)
-            self.refactor_parent(parent)
+        self.base_address = _int(svd_elem, "baseAddress")
+        self.derived_from = svd_elem.get('derivedFrom')
+        if self.derived_from is not None:
+            self.name = _text(svd_elem, "name", parent.peripherals[self.derived_from].name)
+            self.description = _text(svd_elem, "description", parent.peripherals[self.derived_from].description)
+        else:
+            self.description = _text(svd_elem, "description", "")
+            self.name = _text(svd_elem, "name")
+
+        if lazy:
+            self._source = etree.tostring(svd_elem, with_tail=False)
+        else:
+            self._build(svd_elem)
+
+    @property
+    def registers(self) -> SmartDict:
+        if self._registers is None:
+            self._load()
+        return self._registers
+
+    @property
+    def clusters(self) -> SmartDict:
+        if self._clusters is None:
+            self._load()
+        return self._clusters
+
+    def is_loaded(self) -> bool:
+        return self._registers is not None
+
+    def _load(self) -> None:
+        """
+        Build the registers and clusters of a lazily parsed peripheral
+        """
+        svd_elem = etree.fromstring(self._source)
+        self._source = None
+        self._build(svd_elem)
+
+    def _build(self, svd_elem) -> None:
+        if self.derived_from is not None:
+            base = self._svd_file.peripherals[self.derived_from]
+
+            # Derived peripherals share the register layout (fields, enums)
+            # with their base and only get their own rebased register objects
+            self._registers = SmartDict()
+            self._clusters = SmartDict()
+            for name, r in base.registers.items():
+                self._registers[name] = r.derive(self)
+            for name, c in base.clusters.items():
+                self._clusters[name] = c.derive(self)
         else:
             # This doesn't inherit registers from anything
-            self.description = str(getattr(svd_elem, "description", ""))
-            self.name = str(svd_elem.name)
-            self.registers = SmartDict()
-            self.clusters = SmartDict()
-
-            if hasattr(svd_elem, "registers"):
-                registers = [r for r in svd_elem.registers.getchildren() if r.tag in ["cluster", "register"]]
-                for r in registers:
+            self._registers = SmartDict()
+            self._clusters = SmartDict()
+
+            registers_elem = svd_elem.find("registers")
+            if registers_elem is not None:
+                for r in registers_elem.iterchildren("cluster", "register"):
                     if r.tag == "cluster":
                         add_cluster(self, r)
                     elif r.tag == "register":
@@ -330,6 +653,8 @@ class SVDPeripheralRegister:
     A register within a peripheral
     """
 
+    __slots__ = ("parent_base_address", "name", "description", "offset", "access", "size", "fields")
+
     parent_base_address: int
     name: str
     description: str
@@ -340,55 +665,54 @@ class SVDPeripheralRegister:
 
     def __init__(self, svd_elem, parent: SVDPeripheral) -> None:
         self.parent_base_address = parent.base_address
-        self.offset = int(str(svd_elem.addressOffset), 0)
+        self.offset = _int(svd_elem, "addressOffset")
         if 'derivedFrom' in svd_elem.attrib:
             derived_from = svd_elem.attrib['derivedFrom']
-            try:
-                self.name = str(svd_elem.name)
-            except AttributeError:
-                self.name = parent.registers[derived_from].name
-            try:
-                self.description = str(svd_elem.description)
-            except AttributeError:
-                self.description = str(getattr(svd_elem, "description", ""))
-            try:
-                self.access = str(svd_elem.access)
-            except AttributeError:
-                self.access = str(getattr(svd_elem, "access", "read-write"))
-            try:
-                self.size = str(svd_elem.size)
-            except AttributeError:
-                self.size = getattr(svd_elem, "size", 0x20)
-
-            def copier(a: Any) -> Any:
-                return pickle.loads(pickle.dumps(a))
+            self.name = _text(svd_elem, "name", parent.registers[derived_from].name)
+            self.description = _text(svd_elem, "description", "")
+            self.access = _text(svd_elem, "access", "read-write")
+            self.size = _int(svd_elem, "size", 0x20)
 
-            self.fields = copier(parent.registers[derived_from].fields)
-            self.refactor_parent(parent)
+            # Fields carry no addresses, so they are shared with the base register
+            self.fields = parent.registers[derived_from].fields
         else:
-            self.description = str(getattr(svd_elem, "description", ""))
-            self.name = str(svd_elem.name)
-            self.access = str(getattr(svd_elem, "access", "read-write"))
-            self.size = getattr(svd_elem, "size", 0x20)
+            self.description = _text(svd_elem, "description", "")
+            self.name = _text(svd_elem, "name")
+            self.access = _text(svd_elem, "access", "read-write")
+            self.size = _int(svd_elem, "size", 0x20)
 
             self.fields = SmartDict()
-            if hasattr(svd_elem, "fields"):
+            fields_elem = svd_elem.find("fields")
+            if fields_elem is not None:
                 # Filter fields to only consider those of tag "field"
-                fields = [f for f in svd_elem.fields.getchildren() if f.tag == "field"]
-                for f in fields:
-                    self.fields[str(f.name)] = SVDPeripheralRegisterField(f, self)
+                for f in fields_elem.iterchildren("field"):
+                    self.fields[_text(f, "name")] = SVDPeripheralRegisterField(f, self)
 
     def refactor_parent(self, parent: SVDPeripheral) -> None:
         self.parent_base_address = parent.base_address
 
+    def derive(self, parent: Union[SVDPeripheral, SVDRegisterCluster]) -> "SVDPeripheralRegister":
+        """
+        Create a copy of this register for a derived peripheral or cluster
+
+        The copy is shallow: the fields and their enums are shared with this
+        register and must be replaced rather than modified in place.
+
+        Args:
+            parent: The derived SVDPeripheral or SVDRegisterCluster object
+        """
+        reg = copy.copy(self)
+        reg.refactor_parent(parent)
+        return reg
+
     def address(self) -> int:
         return self.parent_base_address + self.offset
 
     def readable(self) -> bool:
-        return self.access in ["read-only", "read-write", "read-writeOnce"]
+        return self.access in READABLE_ACCESS
 
     def writable(self) -> bool:
-        return self.access in ["write-only", "read-write", "writeOnce", "read-writeOnce"]
+        return self.access in WRITABLE_ACCESS
 
     def __str__(self) -> str:
         return str(self.name)
@@ -399,57 +723,67 @@ class SVDPeripheralRegisterField:
     Field within a register
     """
 
+    __slots__ = ("name", "description", "offset", "width", "mask", "access", "enum")
+
     name: str
     description: str
     offset: int
     width: int
+    mask: int
     access: str
     enum: Dict[int, Tuple[str, str]]
 
     def __init__(self, svd_elem, parent: SVDPeripheralRegister) -> None:
-        self.name = str(svd_elem.name)
-        self.description = str(getattr(svd_elem, "description", ""))
+        self.name = _text(svd_elem, "name")
+        self.description = _text(svd_elem, "description", "")
 
         # Try to extract a bit range (offset and width) from the available fields
-        if hasattr(svd_elem, "bitOffset") and hasattr(svd_elem, "bitWidth"):
-            self.offset = int(str(svd_elem.bitOffset))
-            self.width = int(str(svd_elem.bitWidth))
-        elif hasattr(svd_elem, "bitRange"):
-            bitrange = list(map(int, str(svd_elem.bitRange).strip()[1:-1].split(":")))
+        bit_offset = _text(svd_elem, "bitOffset")
+        bit_width = _text(svd_elem, "bitWidth")
+        bit_range = _text(svd_elem, "bitRange")
+        if bit_offset is not None and bit_width is not None:
+            self.offset = int(bit_offset)
+            self.width = int(bit_width)
+        elif bit_range is not None:
+            bitrange = list(map(int, bit_range[1:-1].split(":")))
             self.offset = bitrange[1]
             self.width = 1 + bitrange[0] - bitrange[1]
         else:
-            assert hasattr(svd_elem, "lsb") and hasattr(svd_elem, "msb"),\
+            lsb = _text(svd_elem, "lsb")
+            msb = _text(svd_elem, "msb")
+            assert lsb is not None and msb is not None,\
                 f"Range not found for field {self.name} in register {parent}"
-            lsb = int(str(svd_elem.lsb))
-            msb = int(str(svd_elem.msb))
-            self.offset = lsb
-            self.width = 1 + msb - lsb
-
-        self.access = str(getattr(svd_elem, "access", parent.access))
-        self.enum = {}
-
-        if hasattr(svd_elem, "enumeratedValues"):
-            values = [v for v in svd_elem.enumeratedValues.getchildren() if v.tag == "enumeratedValue"]
-            for v in values:
-                # Skip the "name" tag and any entries that don't have a value
-                if v.tag == "name" or not hasattr(v, "value"):
+            self.offset = int(lsb)
+            self.width = 1 + int(msb) - int(lsb)
+
+        # Mask of the field within the register
+        self.mask = ((1 << self.width) - 1) << self.offset
+        self.access = _text(svd_elem, "access", parent.access)
+        self.enum = NO_ENUM
+
+        values = svd_elem.find("enumeratedValues")
+        if values is not None:
+            for v in values.iterchildren("enumeratedValue"):
+                # Skip any entries that don't have a value
+                value = _text(v, "value")
+                if value is None:
                     continue
                 # Some Kinetis parts have values with # instead of 0x...
-                value = str(v.value).replace("#", "0x")
-                description = str(getattr(v, "description", ""))
+                value = value.replace("#", "0x")
+                description = _text(v, "description", "")
                 try:
-                    index = int(value, 0)
-                    self.enum[int(value, 0)] = (str(v.name), description)
+                    if self.enum is NO_ENUM:
+                        self.enum = {}
+                    self.enum[int(value, 0)] = (_text(v, "name"), description)
                 except ValueError:
                     # If the value couldn't be converted as a single integer, skip it
                     pass
 
     def readable(self) -> bool:
-        return self.access in ["read-only", "read-write", "read-writeOnce"]
+        return self.access in READABLE_ACCESS
 
     def writable(self) -> bool:
-        return self.access in ["write-only", "read-write", "writeOnce", "read-writeOnce"]
+        return self.access in WRITABLE_ACCESS
 
     def __str__(self) -> str:
         return str(self.name)
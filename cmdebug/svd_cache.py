@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+This file is part of PyCortexMDebug
+
+PyCortexMDebug is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCortexMDebug is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import pickle
+import sys
+import tempfile
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cmdebug.svd import SVDFile
+
+# Bump this whenever the layout of the SVD model classes changes so that
+# entries written by older versions are never loaded
+CACHE_FORMAT_VERSION = 7
+
+# Upper bound for the total size of the cache directory, in bytes
+CACHE_MAX_SIZE = int(os.environ.get("CMDEBUG_SVD_CACHE_MAX", 256 * 1024 * 1024))
+
+CACHE_SUFFIX = ".svdcache"
+
+VENDOR_INDEX_NAME = "cmsis_svd_index.json"
+
+
+def cache_dir() -> str:
+    """
+    Directory used for all on-disk caches, honouring $CMDEBUG_CACHE_DIR and $XDG_CACHE_HOME
+    """
+    if "CMDEBUG_CACHE_DIR" in os.environ:
+        return os.path.expanduser(os.environ["CMDEBUG_CACHE_DIR"])
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "cmdebug")
+
+
+def cache_enabled() -> bool:
+    return os.environ.get("CMDEBUG_SVD_CACHE", "1") not in ("0", "no", "off", "false")
+
+
+def _file_digest(fname: str) -> str:
+    h = hashlib.sha256()
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _cache_key(path: str, st: os.stat_result, digest: str) -> Tuple[str, str]:
+    """
+    Build the cache key for an SVD file
+
+    Returns:
+        A (path_key, entry_key) pair. All entries for one SVD path share the
+        same path_key so that stale ones can be found and evicted.
+    """
+    path_key = hashlib.sha256(path.encode("utf-8", "surrogateescape")).hexdigest()[:16]
+    ident = f"{CACHE_FORMAT_VERSION}:{sys.version_info[0]}.{sys.version_info[1]}:" \
+            f"{path}:{st.st_size}:{st.st_mtime_ns}:{digest}"
+    entry_key = hashlib.sha256(ident.encode("utf-8", "surrogateescape")).hexdigest()[:32]
+    return path_key, entry_key
+
+
+def _entries(directory: str) -> List[Tuple[str, os.stat_result]]:
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    entries = []
+    for name in names:
+        if not name.endswith(CACHE_SUFFIX):
+            continue
+        full = os.path.join(directory, name)
+        try:
+            entries.append((full, os.stat(full)))
+        except OSError:
+            pass
+    return entries
+
+
+def _remove(fname: str) -> None:
+    try:
+        os.unlink(fname)
+    except OSError:
+        pass
+
+
+def evict(directory: str, keep: Optional[str] = None, max_size: int = CACHE_MAX_SIZE) -> None:
+    """
+    Trim the cache directory to max_size bytes, dropping the least recently used entries first
+
+    Args:
+        directory: Cache directory
+        keep: Entry that must not be evicted (normally the one just written)
+        max_size: Size cap in bytes
+    """
+    entries = _entries(directory)
+    total = sum(st.st_size for _, st in entries)
+    # Entries are touched on every hit, so mtime is the last use
+    for fname, st in sorted(entries, key=lambda e: e[1].st_mtime):
+        if total <= max_size:
+            break
+        if fname == keep:
+            continue
+        _remove(fname)
+        total -= st.st_size
+
+
+def load_svd_file(fname: str, lazy: bool = False, log: Optional[Callable[[str], None]] = None) -> SVDFile:
+    """
+    Load an SVD file, going through the on-disk cache of parsed models when possible
+
+    The cache entry is keyed on the resolved path, size, modification time and
+    content hash of the SVD file as well as CACHE_FORMAT_VERSION. Any older entry
+    for the same path is removed when a new one is written.
+
+    Args:
+        fname: Filename for the SVD file
+        lazy: Parse the peripherals lazily if the file is not cached yet
+        log: Called with each message about the file or the cache instead of printing it
+    """
+    if not cache_enabled():
+        return SVDFile(fname, lazy, log)
+
+    path = os.path.realpath(os.path.expanduser(fname))
+    st = os.stat(path)
+    directory = cache_dir()
+    path_key, entry_key = _cache_key(path, st, _file_digest(path))
+    entry = os.path.join(directory, f"{path_key}-{entry_key}{CACHE_SUFFIX}")
+
+    try:
+        with open(entry, "rb") as f:
+            version, svd_file = pickle.load(f)
+        if version == CACHE_FORMAT_VERSION and isinstance(svd_file, SVDFile):
+            os.utime(entry)
+            return svd_file
+    except FileNotFoundError:
+        pass
+    except Exception:
+        # Corrupt or incompatible entry, just rebuild it
+        _remove(entry)
+
+    svd_file = SVDFile(path, lazy, log)
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Drop stale entries for this same SVD file
+        for other, _ in _entries(directory):
+            if os.path.basename(other).startswith(path_key + "-") and other != entry:
+                _remove(other)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((CACHE_FORMAT_VERSION, svd_file), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, entry)
+        except BaseException:
+            _remove(tmp)
+            raise
+        evict(directory, keep=entry)
+    except Exception as e:
+        # The cache is only an optimization, never fail a load because of it
+        (log or print)(f"Could not write SVD cache entry {entry}: {e}")
+
+    return svd_file
+
+
+def cmsis_svd_data_dir() -> Optional[str]:
+    """
+    Directory holding the SVD files of the cmsis_svd package, found without importing it
+
+    Returns:
+        The data directory, or None if cmsis_svd is not installed
+    """
+    try:
+        spec = importlib.util.find_spec("cmsis_svd")
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    data_dir = os.path.join(list(spec.submodule_search_locations)[0], "data")
+    return data_dir if os.path.isdir(data_dir) else None
+
+
+def _cmsis_svd_version(data_dir: str) -> str:
+    try:
+        import importlib.metadata
+        return importlib.metadata.version("cmsis-svd")
+    except Exception:
+        # No usable package metadata, fall back to the data directory itself
+        return f"mtime:{os.stat(data_dir).st_mtime_ns}"
+
+
+def cmsis_svd_vendors(log: Optional[Callable[[str], None]] = None) -> Dict[str, List[str]]:
+    """
+    Map of vendor name to the SVD files cmsis_svd ships for it
+
+    Listing thousands of files is slow, so unless caching is disabled the index
+    is persisted in the cache directory and only rebuilt when the installed
+    cmsis_svd version or location changes.
+
+    Args:
+        log: Called with a message if the index cannot be written, instead of printing it
+    """
+    data_dir = cmsis_svd_data_dir()
+    if data_dir is None:
+        return {}
+    enabled = cache_enabled()
+    version = _cmsis_svd_version(data_dir)
+    index_file = os.path.join(cache_dir(), VENDOR_INDEX_NAME)
+
+    if enabled:
+        try:
+            with open(index_file, "r") as f:
+                index = json.load(f)
+            if index.get("version") == version and index.get("data_dir") == data_dir:
+                return index["vendors"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    vendors = {}
+    for vendor in sorted(os.listdir(data_dir)):
+        vendor_dir = os.path.join(data_dir, vendor)
+        if os.path.isdir(vendor_dir):
+            vendors[vendor] = sorted(fname for fname in os.listdir(vendor_dir) if fname.lower().endswith(".svd"))
+
+    if not enabled:
+        return vendors
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir(), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": version, "data_dir": data_dir, "vendors": vendors}, f)
+            os.replace(tmp, index_file)
+        except BaseException:
+            _remove(tmp)
+            raise
+    except Exception as e:
+        # The index is only an optimization, never fail a listing because of it
+        (log or print)(f"Could not write cmsis_svd index {index_file}: {e}")
+
+    return vendors
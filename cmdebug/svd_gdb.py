@@ -15,15 +15,19 @@ You should have received a copy of the GNU General Public License
 along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import bisect
 import gdb
+import os
 import re
 import math
 import sys
 import struct
-import pkg_resources
+import threading
+import time
 
 sys.path.append('.')
-from cmdebug.svd import SVDFile
+from cmdebug.svd_cache import load_svd_file, cmsis_svd_data_dir, cmsis_svd_vendors
+from cmdebug.svd import IRQ_EXCEPTION_BASE
 
 BITS_TO_UNPACK_FORMAT = {
     8: "B",
@@ -31,6 +35,174 @@ BITS_TO_UNPACK_FORMAT = {
     32: "I",
 }
 
+# Largest span fetched with a single read_memory when reading many registers
+MAX_READ_SPAN = 4096
+
+FORM_TO_RADIX = {
+    'x': 16,
+    'a': 16,
+    'o': 8,
+    'b': 2,
+    't': 2,
+}
+
+# NVIC interrupt set-enable, set-pending, active bit and priority registers
+NVIC_ISER = 0xE000E100
+NVIC_ISPR = 0xE000E200
+NVIC_IABR = 0xE000E300
+NVIC_IPR = 0xE000E400
+
+# gdb's output-radix, read again at the start of every svd command
+_output_radix = None
+
+# Formatting callables by (radix, bit length)
+_formatters = {}
+
+
+def output_radix(refresh=False):
+    """ Get gdb's output radix, only asking gdb again when refresh is set
+    """
+    global _output_radix
+    if _output_radix is None or refresh:
+        try:
+            _output_radix = int(gdb.parameter("output-radix"))
+        except (RuntimeError, TypeError, ValueError):
+            _output_radix = int(re.search(r"\d+", gdb.execute("show output-radix", True, True)).group(0))
+    return _output_radix
+
+
+def _make_formatter(radix, length):
+    """ Build a callable formatting numbers of a given bit length in a radix
+    """
+    if radix == 16:
+        # For addresses, probably best in hex too
+        return "0x{{:0{}X}}".format(int(math.ceil(length / 4.0))).format
+    if radix == 8:
+        return "0{{:0{}o}}".format(int(math.ceil(length / 3.0))).format
+    if radix == 2:
+        return "0b{{:0{}b}}".format(length).format
+    # Default: Just return in decimal
+    return str
+
+
+class MemoryCache:
+    """ Target memory read since the target last stopped
+
+    Blocks are only kept while the selected thread is stopped, and everything
+    is dropped whenever the target resumes, stops, exits or has its memory
+    changed from gdb.
+    """
+
+    def __init__(self):
+        self.blocks = {}
+
+    def invalidate(self, *args):
+        self.blocks.clear()
+
+    @staticmethod
+    def _target_stopped():
+        try:
+            thread = gdb.selected_thread()
+        except gdb.error:
+            return False
+        return thread is not None and thread.is_stopped()
+
+    def read(self, address, length, bypass=False):
+        """ Read target memory, reusing a cached block that covers the request
+
+        Args:
+            address: Start address
+            length: Number of bytes
+            bypass: Always read from the target, e.g. for volatile registers
+        """
+        if not bypass:
+            for start, data in self.blocks.items():
+                if start <= address and address + length <= start + len(data):
+                    return data[address - start:address - start + length]
+        data = bytes(gdb.selected_inferior().read_memory(address, length))
+        if self._target_stopped():
+            self.blocks[address] = data
+        return data
+
+
+memory_cache = MemoryCache()
+
+for _event in ("cont", "stop", "memory_changed", "exited"):
+    if hasattr(gdb.events, _event):
+        getattr(gdb.events, _event).connect(memory_cache.invalidate)
+
+
+class SymbolIndex:
+    """ Sorted index of the minimal symbols of all loaded objfiles
+
+    Resolves values to "symbol + offset in section" like "info symbol", but
+    with a binary search instead of a gdb command per value. The index is
+    built from a single "maint print msymbols" and dropped whenever objfiles
+    are loaded or cleared.
+    """
+
+    MSYMBOL_RE = re.compile(r"^\[\s*\d+\]\s+(\S)\s+(0x[0-9a-fA-F]+)\s+(\S+)\s+section\s+(\S+)")
+    SECTION_RE = re.compile(r"(0x[0-9a-fA-F]+)->(0x[0-9a-fA-F]+)\s+at\s+0x[0-9a-fA-F]+:\s+(\S+)")
+
+    def __init__(self):
+        self.starts = None
+        self.symbols = None
+        self.sections = None
+
+    def invalidate(self, *args):
+        self.starts = None
+
+    def _build(self):
+        symbols = []
+        for line in gdb.execute("maint print msymbols", False, True).splitlines():
+            m = self.MSYMBOL_RE.match(line.strip())
+            if m:
+                sym_type, address, name, section = m.groups()
+                # Prefer global symbols when several share an address
+                symbols.append((int(address, 16), sym_type.islower(), name, section))
+        symbols.sort()
+
+        self.sections = {}
+        try:
+            for line in gdb.execute("maint info sections", False, True).splitlines():
+                m = self.SECTION_RE.search(line)
+                if m:
+                    self.sections.setdefault(m.group(3), (int(m.group(1), 16), int(m.group(2), 16)))
+        except gdb.error:
+            pass
+
+        self.symbols = [(address, name, section) for address, _, name, section in symbols]
+        self.starts = [s[0] for s in self.symbols]
+
+    def describe(self, address):
+        """ Describe an address in the same way as "info symbol"
+        """
+        if self.starts is None:
+            self._build()
+        if not self.starts:
+            # Nothing we could parse, let gdb do it
+            return re.sub(r'\s+', ' ', gdb.execute("info symbol {}".format(address), True, True).strip())
+
+        i = bisect.bisect_right(self.starts, address) - 1
+        if i >= 0:
+            # Take the first symbol at the closest address below
+            i = bisect.bisect_left(self.starts, self.starts[i])
+            start, name, section = self.symbols[i]
+            bounds = self.sections.get(section)
+            if bounds is None or bounds[0] <= address < bounds[1]:
+                offset = address - start
+                if offset:
+                    return "{} + {} in section {}".format(name, offset, section)
+                return "{} in section {}".format(name, section)
+        return "No symbol matches {}.".format(hex(address))
+
+
+symbol_index = SymbolIndex()
+
+for _event in ("new_objfile", "clear_objfiles"):
+    if hasattr(gdb.events, _event):
+        getattr(gdb.events, _event).connect(symbol_index.invalidate)
+
 
 class LoadSVD(gdb.Command):
     """ A command to load an SVD file and to create the command for inspecting
@@ -38,20 +210,20 @@ class LoadSVD(gdb.Command):
     """
 
     def __init__(self):
-        self.vendors = {}
-        try:
-            vendor_names = pkg_resources.resource_listdir("cmsis_svd", "data")
-            for vendor in vendor_names:
-                fnames = pkg_resources.resource_listdir("cmsis_svd", "data/{}".format(vendor))
-                self.vendors[vendor] = [fname for fname in fnames if fname.lower().endswith(".svd")]
-        except:
-            pass
+        # Vendor to device index of the cmsis_svd package, built on first completion
+        self._vendors = None
 
-        if len(self.vendors) > 0:
+        if cmsis_svd_data_dir() is not None:
             gdb.Command.__init__(self, "svd_load", gdb.COMMAND_USER)
         else:
             gdb.Command.__init__(self, "svd_load", gdb.COMMAND_DATA, gdb.COMPLETE_FILENAME)
 
+    @property
+    def vendors(self):
+        if self._vendors is None:
+            self._vendors = cmsis_svd_vendors()
+        return self._vendors
+
     def complete(self, text, word):
         args = gdb.string_to_argv(text)
         num_args = len(args)
@@ -74,21 +246,79 @@ class LoadSVD(gdb.Command):
     @staticmethod
     def invoke(args, from_tty):
         args = gdb.string_to_argv(args)
+        options = [a for a in args if a in ("-lazy", "-async")]
+        args = [a for a in args if a not in options]
+        lazy = "-lazy" in options
         argc = len(args)
         if argc == 1:
             gdb.write("Loading SVD file {}...\n".format(args[0]))
             f = args[0]
         elif argc == 2:
             gdb.write("Loading SVD file {}/{}...\n".format(args[0], args[1]))
-            f = pkg_resources.resource_filename("cmsis_svd", "data/{}/{}".format(args[0], args[1]))
+            data_dir = cmsis_svd_data_dir()
+            if data_dir is None:
+                raise gdb.GdbError("The cmsis_svd package is not installed\n")
+            f = os.path.join(data_dir, args[0], args[1])
         else:
-            raise gdb.GdbError("Usage: svd_load <vendor> <device.svd> or svd_load <path/to/filename.svd>\n")
+            raise gdb.GdbError("Usage: svd_load [-lazy] [-async] <vendor> <device.svd> or "
+                               "svd_load [-lazy] [-async] <path/to/filename.svd>\n")
+        if "-async" in options:
+            SVD(PendingSVDFile(f, lazy))
+            return
         try:
-            SVD(SVDFile(f))
+            SVD(load_svd_file(f, lazy))
         except Exception as e:
             raise gdb.GdbError("Could not load SVD file {} : {}...\n".format(f, e))
 
 
+class PendingSVDFile:
+    """ An SVD file being parsed in a background thread
+
+    The svd command holds on to this until it is first used, at which point it
+    waits for parsing to finish if it has not already.
+    """
+
+    def __init__(self, fname, lazy=False):
+        self.fname = fname
+        self.svd_file = None
+        self.error = None
+        # Messages about the file, printed once loading is done
+        self.messages = []
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._load, args=(lazy,), name="svd_load", daemon=True)
+        self.thread.start()
+
+    def _load(self, lazy):
+        start = time.time()
+        try:
+            self.svd_file = load_svd_file(self.fname, lazy, self.messages.append)
+        except Exception as e:
+            self.error = e
+        elapsed = time.time() - start
+        self.done.set()
+        # gdb.write is only safe from gdb's own thread
+        gdb.post_event(lambda: self._report(elapsed))
+
+    def _report(self, elapsed):
+        for message in self.messages:
+            gdb.write("{}\n".format(message))
+        self.messages = []
+        if self.error is not None:
+            gdb.write("Could not load SVD file {} : {}\n".format(self.fname, self.error))
+        else:
+            gdb.write("Loaded SVD file {} in {:.1f}s\n".format(self.fname, elapsed))
+
+    def get(self):
+        """ Get the parsed SVDFile, waiting for the background load if needed
+        """
+        if not self.done.is_set():
+            gdb.write("Waiting for SVD file {} to finish loading...\n".format(self.fname))
+            self.done.wait()
+        if self.error is not None:
+            raise gdb.GdbError("Could not load SVD file {} : {}...\n".format(self.fname, self.error))
+        return self.svd_file
+
+
 if __name__ == "__main__":
     # This will also get executed by GDB
 
@@ -96,6 +326,21 @@ if __name__ == "__main__":
     LoadSVD()
 
 
+# The most recently created svd command, for other commands that want names from the SVD file
+_svd_command = None
+
+
+def loaded_svd_file():
+    """ The SVDFile of the svd command, or None if no SVD file has been loaded
+    """
+    if _svd_command is None:
+        return None
+    try:
+        return _svd_command.svd_file
+    except gdb.GdbError:
+        return None
+
+
 class SVD(gdb.Command):
     """ The CMSIS SVD (System View Description) inspector command
 
@@ -105,28 +350,53 @@ class SVD(gdb.Command):
 
     def __init__(self, svd_file):
         gdb.Command.__init__(self, "svd", gdb.COMMAND_DATA)
-        self.svd_file = svd_file
+        # Either an SVDFile or a PendingSVDFile still being loaded
+        self._svd_file = svd_file
+        # Last values read for each displayed peripheral, by register
+        self.last_values = {}
+        # Peripherals diffed automatically on every stop
+        self.auto_diff = []
+        self.stop_handler_connected = False
+        global _svd_command
+        _svd_command = self
+
+    @property
+    def svd_file(self):
+        if isinstance(self._svd_file, PendingSVDFile):
+            self._svd_file = self._svd_file.get()
+        return self._svd_file
+
+    @staticmethod
+    def _find(smart_dict, key):
+        """ Resolve a key with a single lookup, warning if it is an ambiguous prefix
+        """
+        od_key, candidates = smart_dict.lookup(key)
+        if candidates:
+            gdb.write('Warning: {} could prefix match any of: {}\n'.format(
+                key, ', '.join(candidates)))
+        return None if od_key is None else smart_dict.od[od_key]
 
     def _print_registers(self, container_name, form, registers):
         if len(registers) == 0:
-            return
+            return {}
         try:
             regs_iter = registers.itervalues()
         except AttributeError:
             regs_iter = registers.values()
+        regs = list(regs_iter)
+        values = self.read_registers(regs)
         gdb.write("Registers in %s:\n" % container_name)
         reg_list = []
-        for r in regs_iter:
+        for r in regs:
             if r.readable():
-                try:
-                    data = self.read(r.address(), r.size)
-                    data = self.format(data, form, r.size)
-                    if form == 'a':
-                        data += " <" + re.sub(r'\s+', ' ',
-                                              gdb.execute("info symbol {}".format(data), True,
-                                                          True).strip()) + ">"
-                except gdb.MemoryError:
+                data = values[r]
+                if data is None:
                     data = "(error reading)"
+                else:
+                    value = data
+                    data = self.format(value, form, r.size)
+                    if form == 'a':
+                        data += " <" + symbol_index.describe(value) + ">"
             else:
                 data = "(not readable)"
             desc = re.sub(r'\s+', ' ', r.description)
@@ -139,24 +409,113 @@ class SVD(gdb.Command):
             if reg[2] != reg[0]:
                 gdb.write("  {}".format(reg[2]))
             gdb.write("\n")
+        return values
+
+    @staticmethod
+    def _all_registers(peripheral):
+        """ All registers of a peripheral including those in clusters, with display names
+        """
+        regs = [(r.name, r) for r in peripheral.registers.values()]
+        for c in peripheral.clusters.values():
+            regs.extend((c.name + ' > ' + r.name, r) for r in c.registers.values())
+        return regs
+
+    def _print_diff(self, peripheral, form):
+        """ Re-read a peripheral and show only the registers and fields that changed since it was last read
+        """
+        regs = self._all_registers(peripheral)
+        values = self.read_registers([r for _, r in regs])
+        previous = self.last_values.get(peripheral.name)
+        self.last_values[peripheral.name] = values
+        if previous is None:
+            gdb.write("Recorded {} registers in {}\n".format(len(values), peripheral.name))
+            return
+
+        changed = []
+        for name, r in regs:
+            old = previous.get(r)
+            new = values.get(r)
+            if old is not None and new is not None and old != new:
+                changed.append((name, r, old, new))
+        if not changed:
+            gdb.write("No changes in {}\n".format(peripheral.name))
+            return
+
+        gdb.write("Changes in {}:\n".format(peripheral.name))
+        for name, r, old, new in changed:
+            gdb.write("\t{}: {} -> {}\n".format(name, self.format(old, form, r.size), self.format(new, form, r.size)))
+            for f in r.fields.values():
+                if (old ^ new) & f.mask:
+                    gdb.write("\t\t{}: {} -> {}\n".format(
+                        f.name, self._field_str(f, (old & f.mask) >> f.offset, form),
+                        self._field_str(f, (new & f.mask) >> f.offset, form)))
+
+    def _field_str(self, field, value, form):
+        if value in field.enum:
+            return field.enum[value][0]
+        return self.format(value, form, field.width)
+
+    def _diff_command(self, form, args):
+        if not args[0]:
+            gdb.write("Usage: svd/diff [peripheral_name]... or svd/diff auto [off] [peripheral_name]...\n")
+            return
+
+        if args[0].lower() != 'auto':
+            for name in args:
+                peripheral = self._find(self.svd_file.peripherals, name)
+                if peripheral is None:
+                    gdb.write("Peripheral {} does not exist!\n".format(name))
+                else:
+                    self._print_diff(peripheral, form)
+            return
+
+        args = args[1:]
+        if args and args[0].lower() == 'off':
+            if len(args) == 1:
+                self.auto_diff = []
+            else:
+                off = [self._find(self.svd_file.peripherals, name) for name in args[1:]]
+                self.auto_diff = [(p, f) for p, f in self.auto_diff if p not in off]
+        else:
+            for name in args:
+                peripheral = self._find(self.svd_file.peripherals, name)
+                if peripheral is None:
+                    gdb.write("Peripheral {} does not exist!\n".format(name))
+                elif peripheral not in [p for p, _ in self.auto_diff]:
+                    self.auto_diff.append((peripheral, form))
+                    # Record the starting values right away
+                    self.last_values[peripheral.name] = self.read_registers(
+                        [r for _, r in self._all_registers(peripheral)])
+            if self.auto_diff and not self.stop_handler_connected:
+                gdb.events.stop.connect(self._on_stop)
+                self.stop_handler_connected = True
+
+        if self.auto_diff:
+            gdb.write("Diffing on every stop: {}\n".format(', '.join(p.name for p, _ in self.auto_diff)))
+        else:
+            gdb.write("No peripherals are diffed on stop\n")
+
+    def _on_stop(self, event):
+        output_radix(refresh=True)
+        for peripheral, form in self.auto_diff:
+            try:
+                self._print_diff(peripheral, form)
+            except gdb.error as e:
+                gdb.write("Could not diff {}: {}\n".format(peripheral.name, e))
 
-    def _print_register_fields(self, container_name, form, register):
+    def _print_register_fields(self, container_name, form, register, fields=None):
         gdb.write("Fields in {}:\n".format(container_name))
-        fields = register.fields
+        if fields is None:
+            fields = register.fields.values()
         if not register.readable():
             data = 0
         else:
             data = self.read(register.address(), register.size)
         field_list = []
-        try:
-            fields_iter = fields.itervalues()
-        except AttributeError:
-            fields_iter = fields.values()
-        for f in fields_iter:
+        for f in fields:
             desc = re.sub(r'\s+', ' ', f.description)
             if register.readable():
-                val = data >> f.offset
-                val &= (1 << f.width) - 1
+                val = (data & f.mask) >> f.offset
                 if f.enum:
                     if val in f.enum:
                         desc = f.enum[val][1] + " - " + desc
@@ -178,7 +537,89 @@ class SVD(gdb.Command):
                 gdb.write("  {}".format(field[2]))
             gdb.write("\n")
 
+    def _find_address(self, form, args):
+        if len(args) != 1:
+            gdb.write("Usage: svd find [address]\n")
+            return
+        try:
+            address = int(gdb.parse_and_eval(args[0]))
+        except gdb.error as e:
+            gdb.write("{} is not a valid address: {}\n".format(args[0], e))
+            return
+
+        match = self.svd_file.lookup_address(address)
+        if match is None:
+            gdb.write("No register at address {}\n".format(self.format(address, 'x')))
+            return
+
+        names = [match.peripheral.name]
+        if match.cluster is not None:
+            names.append(match.cluster.name)
+        names.append(match.register.name)
+        location = ' > '.join(names)
+        if match.offset:
+            location += " + {}".format(match.offset)
+        gdb.write("{}: {}\n".format(self.format(address, 'x'), location))
+        if match.fields:
+            self._print_register_fields(' > '.join(names), form, match.register, match.fields)
+
+    def _nvic_state(self, count):
+        """ Read the NVIC enable, pending, active and priority registers for the first count IRQs
+
+        Returns:
+            (enabled, pending, active, priorities) bit masks and priority bytes, or None if they
+            can't be read
+        """
+        words = (count + 31) // 32
+        try:
+            masks = [int.from_bytes(memory_cache.read(base, words * 4), "little")
+                     for base in (NVIC_ISER, NVIC_ISPR, NVIC_IABR)]
+            priorities = bytes(memory_cache.read(NVIC_IPR, count))
+        except gdb.error:
+            return None
+        return masks[0], masks[1], masks[2], priorities
+
+    def _irq_command(self, args):
+        """ Show interrupts by IRQ number or name, with their NVIC state
+        """
+        svd_file = self.svd_file
+        if not args or not args[0]:
+            interrupts = [i for i in svd_file.interrupts if i is not None]
+        else:
+            try:
+                irq = int(args[0], 0)
+            except ValueError:
+                interrupt = self._find(svd_file.interrupt_names, args[0])
+            else:
+                interrupt = svd_file.interrupt(irq)
+            if interrupt is None:
+                gdb.write("Interrupt {} does not exist!\n".format(args[0]))
+                return
+            interrupts = [interrupt]
+        if not interrupts:
+            gdb.write("No interrupts in the SVD file\n")
+            return
+
+        state = self._nvic_state(max(i.value for i in interrupts) + 1)
+        name_width = max(len(i.name) for i in interrupts) + 2
+        peripheral_width = max(len(i.peripheral) for i in interrupts) + 2
+        gdb.write("Interrupts:\n")
+        for i in interrupts:
+            line = "\t{:3} (exception {:3})  {}{}".format(
+                i.value, i.value + IRQ_EXCEPTION_BASE, i.name.ljust(name_width), i.peripheral.ljust(peripheral_width))
+            if state is not None:
+                enabled, pending, active, priorities = state
+                flags = [name for name, mask in (("enabled", enabled), ("pending", pending), ("active", active))
+                         if mask >> i.value & 1]
+                line += "{:24} priority {:#04x}  ".format(",".join(flags) or "-", priorities[i.value])
+            desc = re.sub(r'\s+', ' ', i.description)
+            if desc and desc != i.name:
+                line += desc
+            gdb.write(line.rstrip() + "\n")
+
     def invoke(self, args, from_tty):
+        # Scripts and -ex commands run without a prompt in between, so never trust an older value
+        output_radix(refresh=True)
         s = str(args).split(" ")
         form = ""
         if s[0] and s[0][0] == '/':
@@ -188,9 +629,21 @@ class SVD(gdb.Command):
             else:
                 form = s[0][1:]
                 if len(s) == 1:
-                    return
+                    # svd/diff alone prints its usage
+                    if not form.startswith('diff'):
+                        return
+                    s = s + ['']
                 s = s[1:]
 
+        diff = form.startswith('diff')
+        if diff:
+            form = form[len('diff'):]
+
+        # 'v' (volatile) can be combined with any format to skip cached reads
+        if 'v' in form:
+            memory_cache.invalidate()
+            form = form.replace('v', '')
+
         if s[0].lower() == 'help':
             gdb.write("Usage:\n")
             gdb.write("=========\n")
@@ -200,49 +653,63 @@ class SVD(gdb.Command):
             gdb.write("\tDisplay all registers pertaining to that peripheral\n")
             gdb.write("svd [peripheral_name] [register_name]:\n")
             gdb.write("\tDisplay the fields in that register\n")
+            gdb.write("svd find [address]:\n")
+            gdb.write("\tShow the peripheral, register and fields at an address\n")
+            gdb.write("svd irq [number|name]:\n")
+            gdb.write("\tList the interrupts of the device, or show one, with their NVIC state\n")
+            gdb.write("svd/diff [peripheral_name]...:\n")
+            gdb.write("\tShow the registers and fields that changed since the peripheral was last displayed\n")
+            gdb.write("svd/diff auto [off] [peripheral_name]...:\n")
+            gdb.write("\tDiff (or stop diffing) these peripherals every time the target stops\n")
             gdb.write("svd/[format_character] ...\n")
             gdb.write("\tFormat values using that character\n")
             gdb.write("\td(default):decimal, x: hex, o: octal, b: binary\n")
+            gdb.write("\tv: re-read everything from the target instead of using values cached since the last stop\n")
             gdb.write("\n")
             gdb.write(
                 "Both prefix matching and case-insensitive matching is supported for peripherals, registers, clusters and fields.\n")
             return
 
+        # Wait for a background load to finish before printing anything
+        svd_file = self.svd_file
+
+        if diff:
+            self._diff_command(form, s)
+            return
+
+        if s[0].lower() == 'find':
+            self._find_address(form, s[1:])
+            return
+
+        if s[0].lower() == 'irq':
+            self._irq_command(s[1:])
+            return
+
         if not len(s[0]):
             gdb.write("Available Peripherals:\n")
             try:
-                peripherals = self.svd_file.peripherals.itervalues()
+                peripherals = svd_file.peripherals.itervalues()
             except AttributeError:
-                peripherals = self.svd_file.peripherals.values()
+                peripherals = svd_file.peripherals.values()
             column_width = max(len(p.name) for p in peripherals) + 2  # padding
             try:
-                peripherals = self.svd_file.peripherals.itervalues()
+                peripherals = svd_file.peripherals.itervalues()
             except AttributeError:
-                peripherals = self.svd_file.peripherals.values()
+                peripherals = svd_file.peripherals.values()
             for p in peripherals:
                 desc = re.sub(r'\s+', ' ', p.description)
                 gdb.write("\t{}:{}{}\n".format(p.name, "".ljust(column_width - len(p.name)), desc))
             return
 
-        def warn_if_ambiguous(smart_dict, key):
-            if smart_dict.is_ambiguous(key):
-                gdb.write('Warning: {} could prefix match any of: {}\n'.format(
-
-                    key, ', '.join(smart_dict.prefix_match_iter(key))))
-
         registers = None
         if len(s) >= 1:
-            peripheral_name = s[0]
-            if peripheral_name not in self.svd_file.peripherals:
+            peripheral = self._find(svd_file.peripherals, s[0])
+            if peripheral is None:
                 gdb.write("Peripheral {} does not exist!\n".format(s[0]))
                 return
 
-            warn_if_ambiguous(self.svd_file.peripherals, peripheral_name)
-
-            peripheral = self.svd_file.peripherals[peripheral_name]
-
         if len(s) == 1:
-            self._print_registers(peripheral.name, form, peripheral.registers)
+            self.last_values[peripheral.name] = self._print_registers(peripheral.name, form, peripheral.registers)
             if len(peripheral.clusters) > 0:
                 try:
                     clusters_iter = peripheral.clusters.itervalues()
@@ -266,15 +733,13 @@ class SVD(gdb.Command):
 
         cluster = None
         if len(s) == 2:
-            if s[1] in peripheral.clusters:
-                warn_if_ambiguous(peripheral.clusters, s[1])
-                cluster = peripheral.clusters[s[1]]
+            cluster = self._find(peripheral.clusters, s[1])
+            register = None if cluster is not None else self._find(peripheral.registers, s[1])
+            if cluster is not None:
                 container = peripheral.name + ' > ' + cluster.name
                 self._print_registers(container, form, cluster.registers)
 
-            elif s[1] in peripheral.registers:
-                warn_if_ambiguous(peripheral.registers, s[1])
-                register = peripheral.registers[s[1]]
+            elif register is not None:
                 container = peripheral.name + ' > ' + register.name
 
                 self._print_register_fields(container, form, register)
@@ -285,40 +750,33 @@ class SVD(gdb.Command):
             return
 
         if len(s) == 3:
-            if s[1] not in peripheral.clusters:
+            cluster = self._find(peripheral.clusters, s[1])
+            if cluster is None:
                 gdb.write("Cluster {} in peripheral {} does not exist!\n".format(
                     s[1], peripheral.name))
                 return
-            warn_if_ambiguous(peripheral.clusters, s[1])
 
-            cluster = peripheral.clusters[s[1]]
-            if s[2] not in cluster.registers:
+            register = self._find(cluster.registers, s[2])
+            if register is None:
                 gdb.write("Register {} in cluster {} in peripheral {} does not exist!\n".format(
                     s[2], cluster.name, peripheral.name))
                 return
-            warn_if_ambiguous(cluster.registers, s[2])
-
-            register = cluster.registers[s[2]]
             container = ' > '.join([peripheral.name, cluster.name, register.name])
             self._print_register_fields(container, form, register)
             return
 
         if len(s) == 4:
-            if s[1] not in peripheral.registers:
+            reg = self._find(peripheral.registers, s[1])
+            if reg is None:
                 gdb.write("Register {} in peripheral {} does not exist!\n".format(
                     s[1], peripheral.name))
                 return
-            warn_if_ambiguous(peripheral.registers, s[1])
-
-            reg = peripheral.registers[s[1]]
 
-            if s[2] not in reg.fields:
+            field = self._find(reg.fields, s[2])
+            if field is None:
                 gdb.write("Field {} in register {} in peripheral {} does not exist!\n".format(
                     s[2], reg.name, peripheral.name))
                 return
-            warn_if_ambiguous(reg.fields, s[2])
-
-            field = reg.fields[s[2]]
 
             if not field.writable() or not reg.writable():
                 gdb.write("Field {} in register {} in peripheral {} is read-only!\n".format(
@@ -340,8 +798,8 @@ class SVD(gdb.Command):
             if not reg.readable():
                 data = 0
             else:
-                data = self.read(reg.address(), reg.size)
-            data &= ~(((1 << field.width) - 1) << field.offset)
+                data = self.read(reg.address(), reg.size, bypass=True)
+            data &= ~field.mask
             data |= val << field.offset
             self.write(reg.address(), data, reg.size)
             return
@@ -369,25 +827,85 @@ class SVD(gdb.Command):
             if len(reg) and reg[0] == '&':
                 reg = reg[1:]
 
-            if s[0] not in self.svd_file.peripherals:
+            if s[0].lower() == 'irq':
+                return list(self.svd_file.interrupt_names.prefix_match_iter(s[1]))
+
+            od_key, _ = self.svd_file.peripherals.lookup(s[0])
+            if od_key is None:
                 return []
 
-            per = self.svd_file.peripherals[s[0]]
+            per = self.svd_file.peripherals.od[od_key]
             return list(per.registers.prefix_match_iter(s[1]))
 
         return []
 
     @staticmethod
-    def read(address, bits=32):
+    def read(address, bits=32, bypass=False):
         """ Read from memory and return an integer
+
+        Reads go through the per-stop memory cache unless bypass is set
         """
-        value = gdb.selected_inferior().read_memory(address, bits / 8)
+        value = memory_cache.read(address, bits // 8, bypass)
         unpack_format = "I"
         if bits in BITS_TO_UNPACK_FORMAT:
             unpack_format = BITS_TO_UNPACK_FORMAT[bits]
         # gdb.write("{:x} {}\n".format(address, binascii.hexlify(value)))
         return struct.unpack_from("<" + unpack_format, value)[0]
 
+    @staticmethod
+    def read_spans(registers):
+        """ Group registers into contiguous address spans that can each be fetched with one read
+
+        Only word-aligned 32-bit registers are merged, and never across a gap,
+        so every byte read belongs to a register that would have been read on
+        its own anyway. A bulk read may be done with word accesses by the probe,
+        so byte and halfword registers always get a span of their own and are
+        read at their declared size.
+        """
+        spans = []
+        for r in sorted(registers, key=lambda reg: reg.address()):
+            start = r.address()
+            end = start + r.size // 8
+            span = spans[-1] if spans else None
+            if span is not None and span[3] == r.size == 32 and span[0] % 4 == start % 4 == 0 and start <= span[1] \
+                    and end - span[0] <= MAX_READ_SPAN:
+                span[1] = max(span[1], end)
+                span[2].append(r)
+            else:
+                spans.append([start, end, [r], r.size])
+        return spans
+
+    @classmethod
+    def read_registers(cls, registers, bypass=False):
+        """ Read the values of many registers, coalescing adjacent ones into bulk reads
+
+        Returns:
+            A dict mapping each readable register to its value, or to None if it
+            could not be read
+        """
+        values = {}
+        for start, end, regs, bits in cls.read_spans(r for r in registers if r.readable()):
+            if len(regs) == 1:
+                try:
+                    values[regs[0]] = cls.read(start, bits, bypass)
+                except gdb.MemoryError:
+                    values[regs[0]] = None
+                continue
+            try:
+                buf = memory_cache.read(start, end - start, bypass)
+            except gdb.MemoryError:
+                # Fall back to single reads so only the faulting registers are lost
+                for r in regs:
+                    try:
+                        values[r] = cls.read(r.address(), r.size, bypass)
+                    except gdb.MemoryError:
+                        values[r] = None
+                continue
+            unpack_format = "<" + BITS_TO_UNPACK_FORMAT.get(bits, "I")
+            for r in regs:
+                values[r] = struct.unpack_from(unpack_format, buf, r.address() - start)[0]
+        return values
+
     @staticmethod
     def write(address, data, bits=32):
         """ Write data to memory
@@ -396,35 +914,20 @@ class SVD(gdb.Command):
         if bits in BITS_TO_UNPACK_FORMAT:
             pack_format = BITS_TO_UNPACK_FORMAT[bits]
         data = struct.pack (pack_format, data)
-        gdb.selected_inferior().write_memory(address, bytes(data), bits / 8)
+        memory_cache.invalidate()
+        gdb.selected_inferior().write_memory(address, bytes(data), bits // 8)
 
     @staticmethod
     def format(value, form, length=32):
         """ Format a number based on a format character and length
         """
-        # get current gdb radix setting
-        radix = int(re.search(r"\d+", gdb.execute("show output-radix", True, True)).group(0))
-
-        # override it if asked to
-        if form == 'x' or form == 'a':
-            radix = 16
-        elif form == 'o':
-            radix = 8
-        elif form == 'b' or form == 't':
-            radix = 2
-
-        # format the output
-        if radix == 16:
-            # For addresses, probably best in hex too
-            l = int(math.ceil(length / 4.0))
-            return "0x" + "{:X}".format(value).zfill(l)
-        if radix == 8:
-            l = int(math.ceil(length / 3.0))
-            return "0" + "{:o}".format(value).zfill(l)
-        if radix == 2:
-            return "0b" + "{:b}".format(value).zfill(length)
-        # Default: Just return in decimal
-        return str(value)
+        # use the gdb radix setting unless asked to override it
+        radix = FORM_TO_RADIX.get(form) or output_radix()
+        try:
+            formatter = _formatters[(radix, length)]
+        except KeyError:
+            formatter = _formatters[(radix, length)] = _make_formatter(radix, length)
+        return formatter(value)
 
     def peripheral_list(self):
         try:
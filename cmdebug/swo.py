@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Live SWO ingestion with asyncio
+
+Reads the raw SWO byte stream that OpenOCD and other probe servers expose on
+a TCP port or a FIFO, decodes it with the ITM decoder as it arrives and hands
+the data of each stimulus port to a sink. Reading and decoding are decoupled
+by a bounded queue: when decoding falls behind, reading pauses, so the
+data backs up into the socket or pipe instead of being dropped.
+
+This module does not depend on gdb, it can be run standalone:
+
+    python -m cmdebug.swo localhost:3443 --port 0 --file 1=port1.bin
+
+The gdb side lives in swo_gdb.py.
+
+===============================================================================
+
+This file is part of PyCortexMDebug
+
+PyCortexMDebug is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCortexMDebug is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import asyncio
+import os
+import stat
+import sys
+import threading
+
+from typing import BinaryIO, Callable, Dict, Optional, Tuple
+
+from cmdebug.itm import Extension, ITMDecoder, Overflow, Packet, Stimulus
+
+# Read size from the source and number of chunks that may be queued for decoding
+CHUNK_SIZE = 64 * 1024
+QUEUE_SIZE = 64
+
+# Default OpenOCD "swo ... -output :port" style endpoint
+DEFAULT_PORT = 3443
+
+
+class LineSink:
+    """
+    Collects the bytes written to one stimulus port and passes on complete lines
+    """
+
+    def __init__(self, port: int, callback: Callable[[int, str], None], encoding: str = "utf-8") -> None:
+        """
+
+        Args:
+            port: Stimulus port number, passed to the callback
+            callback: Called with (port, line) for every complete line, without the newline
+            encoding: Encoding of the text written by the target
+        """
+        self.port = port
+        self.callback = callback
+        self.encoding = encoding
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self.buffer += data
+        if b"\n" not in data:
+            return
+        *lines, rest = self.buffer.split(b"\n")
+        self.buffer = bytearray(rest)
+        for line in lines:
+            self.callback(self.port, line.rstrip(b"\r").decode(self.encoding, "replace"))
+
+    def close(self) -> None:
+        if self.buffer:
+            self.callback(self.port, self.buffer.decode(self.encoding, "replace"))
+            self.buffer = bytearray()
+
+
+class FileSink:
+    """
+    Writes the raw bytes of one stimulus port to a file
+    """
+
+    def __init__(self, f: BinaryIO) -> None:
+        self.f = f
+
+    def write(self, data: bytes) -> None:
+        self.f.write(data)
+
+    def close(self) -> None:
+        self.f.close()
+
+
+def parse_source(spec: str) -> Tuple[str, object]:
+    """
+    Parse a source specification
+
+    "host:port", ":port", "port" and "tcp:host:port" are TCP endpoints, anything
+    else is the path of a FIFO (or character device) to read from.
+
+    Returns:
+        ("tcp", (host, port)) or ("fifo", path)
+    """
+    if spec.startswith("tcp:"):
+        spec = spec[4:]
+    elif os.path.exists(spec):
+        return "fifo", spec
+    host, _, port = spec.rpartition(":")
+    if not port.isdigit():
+        return "fifo", spec
+    return "tcp", (host or "localhost", int(port))
+
+
+def _open_blocking(loop: asyncio.AbstractEventLoop, path: str) -> "asyncio.Future[int]":
+    """
+    Open a file for reading on a daemon thread
+
+    Opening a FIFO blocks until the writer side is opened, and a non-blocking
+    open would read EOF instead. An executor thread stuck there would keep the
+    interpreter from exiting, so a daemon thread is used, and the descriptor is
+    closed if the open is cancelled before it completes.
+    """
+    future = loop.create_future()
+
+    def done(fd, error):
+        if future.cancelled():
+            if fd is not None:
+                os.close(fd)
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(fd)
+
+    def run():
+        try:
+            fd, error = os.open(path, os.O_RDONLY), None
+        except OSError as e:
+            fd, error = None, e
+        try:
+            loop.call_soon_threadsafe(done, fd, error)
+        except RuntimeError:
+            # The loop is already closed
+            if fd is not None:
+                os.close(fd)
+
+    threading.Thread(target=run, name="swo-open", daemon=True).start()
+    return future
+
+
+async def open_source(spec: str) -> Tuple[asyncio.StreamReader, Callable[[], None]]:
+    """
+    Connect to a TCP endpoint or open a FIFO for reading
+
+    Returns:
+        A stream reader and a function that closes the source
+    """
+    kind, where = parse_source(spec)
+    if kind == "tcp":
+        reader, writer = await asyncio.open_connection(*where)
+        return reader, writer.close
+
+    loop = asyncio.get_running_loop()
+    fd = await _open_blocking(loop, where)
+    if stat.S_ISREG(os.fstat(fd).st_mode):
+        os.close(fd)
+        raise ValueError(f"{where} is a regular file, decode it with python -m cmdebug.itm instead")
+    os.set_blocking(fd, False)
+    reader = asyncio.StreamReader(limit=CHUNK_SIZE)
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),
+                                                os.fdopen(fd, "rb", buffering=0))
+    return reader, transport.close
+
+
+class SWOReader:
+    """
+    Decodes an SWO stream and dispatches stimulus port data to per-port sinks
+
+    Each decoded chunk is written to the sinks as one call per port rather
+    than one per packet. Ports without a sink are ignored, other packets go to
+    the optional on_packet callback.
+    """
+
+    def __init__(self, sinks: Dict[int, object], on_packet: Optional[Callable[[Packet], None]] = None,
+                 queue_size: int = QUEUE_SIZE, chunk_size: int = CHUNK_SIZE, tpiu_source: Optional[int] = None) -> None:
+        """
+
+        Args:
+            sinks: Stimulus port number to an object with write(bytes) and close() methods
+            on_packet: Called for every packet that is not stimulus port data
+            queue_size: Number of chunks read ahead of the decoder before reading pauses
+            chunk_size: Maximum size of a single read
+            tpiu_source: Trace source ID of the ITM when the stream uses the TPIU formatter
+        """
+        self.sinks = sinks
+        self.on_packet = on_packet
+        self.queue_size = queue_size
+        self.chunk_size = chunk_size
+        self.decoder = ITMDecoder()
+        self.tpiu_source = tpiu_source
+        self.deformatter = None
+        if tpiu_source is not None:
+            # Only pulls in numpy when the formatter is actually used
+            from cmdebug.tpiu import TPIUDeformatter
+            self.deformatter = TPIUDeformatter()
+        self.page = 0
+        self.bytes_read = 0
+        self.overflows = 0
+        self.stalls = 0
+
+    async def run(self, reader: asyncio.StreamReader) -> None:
+        """
+        Ingest the stream until it ends or the task is cancelled
+        """
+        queue = asyncio.Queue(self.queue_size)
+        consumer = asyncio.ensure_future(self._consume(queue))
+        try:
+            while True:
+                chunk = await reader.read(self.chunk_size)
+                if not chunk:
+                    break
+                self.bytes_read += len(chunk)
+                if queue.full():
+                    # The decoder is behind, stop reading until it catches up
+                    self.stalls += 1
+                await queue.put(chunk)
+            await queue.put(None)
+            await consumer
+        finally:
+            consumer.cancel()
+            self.close()
+
+    def close(self) -> None:
+        """
+        Close all sinks, also when run() never got to start
+        """
+        for sink in self.sinks.values():
+            sink.close()
+
+    async def _consume(self, queue: asyncio.Queue) -> None:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                return
+            self.process(chunk)
+            # Let the reader refill the queue between chunks
+            await asyncio.sleep(0)
+
+    def process(self, chunk: bytes) -> None:
+        """
+        Decode one chunk and write out the stimulus port data it contains
+        """
+        if self.deformatter is not None:
+            chunk = self.deformatter.feed(chunk).get(self.tpiu_source, b"")
+        out = {}
+        sinks = self.sinks
+        for packet in self.decoder.feed(chunk):
+            if type(packet) is Stimulus:
+                port = self.page * 32 + packet.port
+                if port in sinks:
+                    data = out.get(port)
+                    if data is None:
+                        data = out[port] = bytearray()
+                    data += packet.value.to_bytes(packet.size, "little")
+                continue
+            if type(packet) is Extension and not packet.hardware:
+                # Stimulus port page for targets with more than 32 ports
+                self.page = packet.value & 7
+            elif type(packet) is Overflow:
+                self.overflows += 1
+            if self.on_packet is not None:
+                self.on_packet(packet)
+        for port, data in out.items():
+            sinks[port].write(bytes(data))
+
+
+class SWOThread:
+    """
+    Runs an SWOReader on its own event loop in a background thread
+
+    Used from gdb, whose main thread must stay free. Callbacks of the sinks
+    run on the background thread.
+    """
+
+    def __init__(self, spec: str, reader: SWOReader) -> None:
+        self.spec = spec
+        self.reader = reader
+        self.error = None
+        self.loop = asyncio.new_event_loop()
+        # Created before the thread starts, so that stop() always has a task to cancel
+        self.task = self.loop.create_task(self._main())
+        self.thread = threading.Thread(target=self._run, name="swo", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            # A failed open or a cancel before the reader started leaves the sinks open
+            self.reader.close()
+            self.loop.close()
+
+    async def _main(self) -> None:
+        stream, close = await open_source(self.spec)
+        try:
+            await self.reader.run(stream)
+        finally:
+            close()
+
+    def running(self) -> bool:
+        return self.thread.is_alive()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        if self.running():
+            try:
+                self.loop.call_soon_threadsafe(self.task.cancel)
+            except RuntimeError:
+                # The loop finished and was closed in the meantime
+                pass
+        self.thread.join(timeout)
+
+
+def _print_line(port: int, line: str) -> None:
+    print(f"[{port}] {line}" if port else line, flush=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Decode a live SWO stream from a TCP port or FIFO")
+    parser.add_argument("source", nargs="?", default=str(DEFAULT_PORT),
+                        help=f"host:port, tcp:host:port or FIFO path (default: localhost:{DEFAULT_PORT})")
+    parser.add_argument("--port", type=int, action="append", default=[],
+                        help="stimulus port to print as text lines (default: 0)")
+    parser.add_argument("--file", action="append", default=[], metavar="PORT=PATH",
+                        help="write the raw data of a stimulus port to a file")
+    parser.add_argument("--queue", type=int, default=QUEUE_SIZE, help="chunks buffered ahead of the decoder")
+    parser.add_argument("--tpiu", type=int, metavar="ID", help="the stream uses the TPIU formatter, ITM has this ID")
+    args = parser.parse_args(argv)
+
+    sinks = {}
+    for item in args.file:
+        port, _, path = item.partition("=")
+        sinks[int(port)] = FileSink(open(path, "wb"))
+    for port in args.port or ([] if sinks else [0]):
+        sinks[port] = LineSink(port, _print_line)
+
+    reader = SWOReader(sinks, queue_size=args.queue, tpiu_source=args.tpiu)
+
+    async def run():
+        stream, close = await open_source(args.source)
+        try:
+            await reader.run(stream)
+        finally:
+            close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    except (OSError, ValueError) as e:
+        print(f"swo: {e}", file=sys.stderr)
+        return 1
+    finally:
+        reader.close()
+    if reader.overflows:
+        print(f"swo: {reader.overflows} ITM overflow packets, the target dropped data", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
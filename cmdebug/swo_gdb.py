@@ -0,0 +1,116 @@
+"""
+This file is part of PyCortexMDebug
+
+PyCortexMDebug is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCortexMDebug is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import gdb
+
+from cmdebug.swo import DEFAULT_PORT, FileSink, LineSink, SWOReader, SWOThread
+
+prefix = "swo : "
+
+
+class SWO(gdb.Command):
+    """ Show the ITM output of the target from a live SWO stream
+    """
+
+    def __init__(self):
+        gdb.Command.__init__(self, "swo", gdb.COMMAND_DATA)
+        self.thread = None
+
+    @staticmethod
+    def _write_line(port, line):
+        # Sink callbacks run on the reader thread, only gdb's main thread may write
+        gdb.post_event(lambda: gdb.write("[{}] {}\n".format(port, line) if port else line + "\n"))
+
+    def invoke(self, args, from_tty):
+        s = str(args).split()
+        if not s or s[0] == "help":
+            self.print_help()
+        elif s[0] == "start":
+            self.start(s[1:])
+        elif s[0] == "stop":
+            self.stop()
+        elif s[0] == "status":
+            self.status()
+        else:
+            self.print_help()
+
+    def start(self, s):
+        if self.thread is not None and self.thread.running():
+            raise gdb.GdbError("Already reading SWO from {}, use swo stop first\n".format(self.thread.spec))
+        source = str(DEFAULT_PORT)
+        sinks = {}
+        tpiu_source = None
+        try:
+            for arg in s:
+                port, eq, path = arg.partition("=")
+                if port == "tpiu":
+                    tpiu_source = int(path, 0)
+                elif eq:
+                    sinks[int(port, 0)] = FileSink(open(path, "wb"))
+                elif arg.isdigit():
+                    sinks[int(arg)] = LineSink(int(arg), self._write_line)
+                else:
+                    source = arg
+        except (ValueError, OSError) as e:
+            for sink in sinks.values():
+                sink.close()
+            raise gdb.GdbError("Invalid arguments: {}\n".format(e))
+        if not sinks:
+            sinks[0] = LineSink(0, self._write_line)
+        self.thread = SWOThread(source, SWOReader(sinks, tpiu_source=tpiu_source))
+        gdb.write(prefix + "Reading SWO from {}, stimulus ports {}\n".format(
+            source, ", ".join(str(p) for p in sorted(sinks))))
+
+    def stop(self):
+        if self.thread is None:
+            gdb.write(prefix + "Not running\n")
+            return
+        self.thread.stop()
+        self.status()
+
+    def status(self):
+        if self.thread is None:
+            gdb.write(prefix + "Not running\n")
+            return
+        t = self.thread
+        state = "running" if t.running() else "stopped"
+        if t.error is not None:
+            state += " ({})".format(t.error)
+        gdb.write(prefix + "{} {}: {} bytes, {} overflows, {} reader stalls\n".format(
+            t.spec, state, t.reader.bytes_read, t.reader.overflows, t.reader.stalls))
+
+    @staticmethod
+    def complete(text, word):
+        s = str(text).split(" ")
+        if len(s) == 1:
+            return [x for x in ["start", "stop", "status"] if x.startswith(s[0])]
+        return gdb.COMPLETE_FILENAME
+
+    @staticmethod
+    def print_help():
+        gdb.write("Usage:\n")
+        gdb.write("=========\n")
+        gdb.write("swo start [source] [port...] [port=file...] [tpiu=id]\n")
+        gdb.write("\tRead SWO from source in the background, host:port or a FIFO path (default :{})\n".format(
+            DEFAULT_PORT))
+        gdb.write("\tLines written to the given stimulus ports (default 0) are printed,\n")
+        gdb.write("\tport=file writes the raw data of a port to a file instead\n")
+        gdb.write("\ttpiu=id deformats TPIU frames first, taking the ITM data from trace source id\n")
+        gdb.write("swo stop\n")
+        gdb.write("\tStop reading\n")
+        gdb.write("swo status\n")
+        gdb.write("\tShow the number of bytes read and ITM overflows\n")
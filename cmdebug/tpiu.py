@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Deformatter for the CoreSight TPIU formatter protocol
+
+With the formatter enabled, the TPIU interleaves the output of several trace
+sources (ITM, ETM, ...) in 16 byte frames, separated now and then by frame
+synchronization packets. TPIUDeformatter strips the synchronization packets
+and splits the frames back into one byte stream per trace source ID.
+
+Frames are decoded in bulk with NumPy when it is installed, with a pure Python
+fallback that gives the same results:
+
+    python -m cmdebug.tpiu capture.bin --split capture
+
+writes the stream of each source to capture.<id>.bin.
+
+===============================================================================
+
+This file is part of PyCortexMDebug
+
+PyCortexMDebug is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCortexMDebug is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import sys
+
+from typing import BinaryIO, Dict, Generator, Optional, Tuple, Union
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FRAME_SIZE = 16
+FRAME_SYNC = b"\xff\xff\xff\x7f"
+
+# Data slots per frame: bytes 0-14, byte 15 holds the low bits of the even ones
+SLOTS = 15
+
+# ID 0 marks unused slots, 0x70 and up are reserved
+NULL_ID = 0x00
+MAX_SOURCE_ID = 0x6F
+
+
+def _frames_python(data, start: int, count: int, current: int, out: Dict[int, bytearray]) -> int:
+    """
+    Deformat count frames of data starting at start
+
+    Args:
+        current: Source ID in effect before the first frame
+        out: Source ID to the bytearray the data of that source is appended to
+
+    Returns:
+        The source ID in effect after the last frame
+    """
+    for f in range(start, start + count * FRAME_SIZE, FRAME_SIZE):
+        aux = data[f + 15]
+        # An ID change delayed by its aux bit takes effect after the next byte
+        delayed = None
+        for k in range(8):
+            b = data[f + 2 * k]
+            if b & 1:
+                if aux >> k & 1 and k < 7:
+                    delayed = b >> 1
+                else:
+                    current = b >> 1
+            else:
+                if current != NULL_ID and current <= MAX_SOURCE_ID:
+                    out.setdefault(current, bytearray()).append(b | (aux >> k & 1))
+            if k == 7:
+                break
+            b = data[f + 2 * k + 1]
+            if current != NULL_ID and current <= MAX_SOURCE_ID:
+                out.setdefault(current, bytearray()).append(b)
+            if delayed is not None:
+                current = delayed
+                delayed = None
+    return current
+
+
+def _frames_numpy(data, start: int, count: int, current: int, out: Dict[int, bytearray]) -> int:
+    """
+    NumPy version of _frames_python, working on all frames at once
+    """
+    frames = numpy.frombuffer(data, numpy.uint8, count * FRAME_SIZE, start).reshape(count, FRAME_SIZE)
+    aux = frames[:, 15:16]
+    even = frames[:, 0:15:2]
+    aux_bits = (aux >> numpy.arange(8, dtype=numpy.uint8)) & 1
+
+    # Data value of every slot, with the low bit of the even slots taken from the aux byte
+    values = numpy.empty((count, SLOTS), numpy.uint8)
+    values[:, 0:15:2] = (even & 0xFE) | aux_bits
+    values[:, 1:15:2] = frames[:, 1:15:2]
+
+    # ID changes, and the slot each one takes effect at in the flattened slot sequence
+    is_id = numpy.zeros((count, SLOTS), bool)
+    is_id[:, 0:15:2] = even & 1
+    change_frame, change_k = numpy.nonzero(even & 1)
+    delay = aux_bits[change_frame, change_k].astype(numpy.intp)
+    delay[change_k == 7] = 0
+    effective = change_frame * SLOTS + numpy.minimum(2 * change_k + 1 + delay, SLOTS)
+    new_ids = even[change_frame, change_k] >> 1
+
+    # Forward fill the source ID over all slots, starting from the current one
+    total = count * SLOTS
+    fill = numpy.zeros(total + 1, numpy.intp)
+    fill[effective] = numpy.arange(1, len(effective) + 1)
+    numpy.maximum.accumulate(fill, out=fill)
+    id_table = numpy.concatenate(([current], new_ids)).astype(numpy.uint8)
+    slot_ids = id_table[fill[:total]]
+
+    is_data = ~is_id.ravel()
+    data_ids = slot_ids[is_data]
+    data_values = values.ravel()[is_data]
+    for source in numpy.unique(data_ids):
+        source = int(source)
+        if source != NULL_ID and source <= MAX_SOURCE_ID:
+            out.setdefault(source, bytearray()).extend(data_values[data_ids == source].tobytes())
+    return int(id_table[fill[total]])
+
+
+class TPIUDeformatter:
+    """
+    Incremental TPIU deformatter
+
+    Nothing is output until the first frame synchronization packet has been
+    seen, since frame boundaries are unknown before. Bytes that end up between
+    frames and a synchronization packet that does not fall on a frame boundary
+    are counted in `discarded`.
+    """
+
+    def __init__(self, use_numpy: Optional[bool] = None) -> None:
+        """
+
+        Args:
+            use_numpy: Decode with NumPy, by default whenever it is installed
+        """
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        if use_numpy and numpy is None:
+            raise ImportError("numpy is not installed")
+        self._frames = _frames_numpy if use_numpy else _frames_python
+        self._pending = b""
+        self.synced = False
+        self.current = NULL_ID
+        self.discarded = 0
+        self.frames = 0
+
+    def feed(self, data: Union[bytes, bytearray, memoryview]) -> Dict[int, bytes]:
+        """
+        Deformat the next chunk of the stream
+
+        Returns:
+            The data of each source ID in this chunk
+        """
+        buf = self._pending + bytes(data) if self._pending else bytes(data)
+        out = {}
+        pos = 0
+        if not self.synced:
+            i = buf.find(FRAME_SYNC)
+            if i < 0:
+                # Keep what could be the start of a synchronization packet
+                self._pending = buf[-(len(FRAME_SYNC) - 1):]
+                return {}
+            self.synced = True
+            pos = i + len(FRAME_SYNC)
+
+        # Synchronization packets sit between frames: drop them first so that all
+        # frames of the chunk are deformatted in one go
+        segments = buf[pos:].split(FRAME_SYNC) if pos else buf.split(FRAME_SYNC)
+        last = segments.pop()
+        frames = []
+        for segment in segments:
+            whole = len(segment) - len(segment) % FRAME_SIZE
+            # Anything else before a synchronization packet means alignment was lost
+            self.discarded += len(segment) - whole
+            frames.append(segment if whole == len(segment) else segment[:whole])
+        whole = len(last) - len(last) % FRAME_SIZE
+        frames.append(last[:whole])
+        self._pending = last[whole:]
+
+        frames = b"".join(frames)
+        count = len(frames) // FRAME_SIZE
+        if count:
+            self.current = self._frames(frames, 0, count, self.current, out)
+            self.frames += count
+        return {source: bytes(stream) for source, stream in out.items()}
+
+
+def deformat_stream(f: BinaryIO, chunk_size: int = 1 << 20,
+                    use_numpy: Optional[bool] = None) -> Generator[Tuple[int, bytes], None, None]:
+    """
+    Deformat a whole file or pipe
+
+    Yields:
+        (source ID, data) pairs, in stream order for each source
+    """
+    deformatter = TPIUDeformatter(use_numpy)
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        yield from deformatter.feed(chunk).items()
+
+
+def source_stream(f: BinaryIO, source: int, chunk_size: int = 1 << 20) -> Generator[bytes, None, None]:
+    """
+    The data of a single trace source, for example to feed the ITM decoder
+    """
+    for source_id, data in deformat_stream(f, chunk_size):
+        if source_id == source:
+            yield data
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Split a TPIU formatted trace capture into its trace sources")
+    parser.add_argument("capture", help="Capture file, - for stdin")
+    parser.add_argument("--split", metavar="PREFIX", help="Write the data of each source to PREFIX.<id>.bin")
+    parser.add_argument("--source", type=int, help="Write the data of this source ID to stdout")
+    parser.add_argument("--no-numpy", action="store_true", help="Use the pure Python deformatter")
+    args = parser.parse_args(argv)
+
+    f = sys.stdin.buffer if args.capture == "-" else open(args.capture, "rb")
+    files = {}
+    sizes = {}
+    try:
+        for source, data in deformat_stream(f, use_numpy=False if args.no_numpy else None):
+            sizes[source] = sizes.get(source, 0) + len(data)
+            if args.source == source:
+                sys.stdout.buffer.write(data)
+            if args.split:
+                if source not in files:
+                    files[source] = open("{}.{}.bin".format(args.split, source), "wb")
+                files[source].write(data)
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+        for out in files.values():
+            out.close()
+    if args.source is None:
+        for source, size in sorted(sizes.items()):
+            print("source {:3}: {} bytes".format(source, size))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
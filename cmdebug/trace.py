@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Absolute timestamps for ITM/DWT trace and export to the Chrome trace event format
+
+ITM local timestamp packets carry the time since the previous local
+timestamp and follow the packets they apply to; global timestamp packets
+carry (parts of) an absolute counter value. TimestampReconstructor turns both
+into an absolute time for every other packet, ChromeTraceWriter streams the
+result as Chrome trace event JSON, which chrome://tracing and the Perfetto UI
+open directly:
+
+    python -m cmdebug.trace capture.bin trace.json --clk 72e6
+
+===============================================================================
+
+This file is part of PyCortexMDebug
+
+PyCortexMDebug is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCortexMDebug is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import sys
+
+from typing import Callable, Dict, Generator, Iterable, Optional, TextIO, Tuple
+
+from cmdebug.itm import (EXC_ENTERED, EXC_EXITED, ExceptionTrace, GlobalTimestamp1, GlobalTimestamp2,
+                         LocalTimestamp, Overflow, Packet, Stimulus, Sync, decode_stream)
+
+# Packets that are still waiting for their timestamp are given the last known
+# time once this many have accumulated, so memory stays bounded when the
+# target does not emit local timestamps at all
+MAX_PENDING = 4096
+
+# ITM_TCR.TSPrescale
+TS_PRESCALERS = (1, 4, 16, 64)
+
+SYSTEM_EXCEPTIONS = {
+    1: "Reset",
+    2: "NMI",
+    3: "HardFault",
+    4: "MemManage",
+    5: "BusFault",
+    6: "UsageFault",
+    11: "SVCall",
+    12: "DebugMonitor",
+    14: "PendSV",
+    15: "SysTick",
+}
+
+
+def exception_name(number: int) -> str:
+    """
+    Default name of an exception number, IRQn for external interrupts
+    """
+    if number >= 16:
+        return "IRQ{}".format(number - 16)
+    return SYSTEM_EXCEPTIONS.get(number, "Exception{}".format(number))
+
+
+class TimestampReconstructor:
+    """
+    Assigns a time in timestamp clock cycles to every packet that is not itself a timestamp
+
+    Without local timestamps the global timestamp is the time. With them,
+    times are the local timestamps since the start of the capture, multiplied
+    by the prescaler that divides only the local timestamp clock. The first
+    complete global timestamp pins that timebase to global time (`origin` is
+    then the global time of tick 0, for lining up captures), and every later
+    one corrects the local count for drift and lost deltas. Both are assumed
+    to count the same clock.
+
+    A global timestamp is only complete once its high bits (GTS2) have been
+    seen; until then the low 26 bits count from zero. Times never go back,
+    a global timestamp behind the local count only holds the time still.
+    """
+
+    def __init__(self, prescaler: int = 1, max_pending: int = MAX_PENDING) -> None:
+        """
+
+        Args:
+            prescaler: ITM timestamp prescaler (ITM_TCR.TSPrescale) of the local timestamps
+            max_pending: Number of packets held back waiting for a timestamp
+        """
+        self.prescaler = prescaler
+        self.max_pending = max_pending
+        self.local = 0
+        self.has_local = False
+        self.global_low = 0
+        self.global_high = 0
+        self.has_high = False
+        # Global time at local time 0, set by the first complete global timestamp
+        self.origin = None
+        # Time and local count at the last complete global timestamp
+        self.anchor_time = 0
+        self.anchor_local = 0
+        self.last = 0
+        self.pending = []
+
+    @property
+    def global_time(self) -> int:
+        return self.global_high | self.global_low
+
+    @property
+    def now(self) -> int:
+        if not self.has_local:
+            now = self.global_time
+        else:
+            now = self.anchor_time + (self.local - self.anchor_local) * self.prescaler
+        return max(now, self.last)
+
+    def _anchor(self) -> None:
+        if self.origin is None:
+            self.origin = self.global_time - self.local * self.prescaler
+        self.anchor_time = self.global_time - self.origin
+        self.anchor_local = self.local
+
+    def feed(self, packets: Iterable[Packet]) -> Generator[Tuple[int, Packet], None, None]:
+        """
+        Yield (ticks, packet) pairs, in stream order
+
+        Packets are held back until the timestamp that follows them arrives.
+        """
+        pending = self.pending
+        for packet in packets:
+            kind = type(packet)
+            if kind is LocalTimestamp:
+                self.local += packet.delta
+                self.has_local = True
+            elif kind is GlobalTimestamp1:
+                mask = (1 << packet.bits) - 1
+                # On a wrap the GTS2 packet with the new high bits follows
+                self.global_low = (self.global_low & ~mask) | packet.value
+                if self.has_local:
+                    if self.has_high and not packet.wrap:
+                        self._anchor()
+                    continue
+            elif kind is GlobalTimestamp2:
+                self.global_high = packet.value
+                self.has_high = True
+                if self.has_local:
+                    self._anchor()
+                    continue
+            elif kind is Sync:
+                continue
+            else:
+                pending.append(packet)
+                if len(pending) < self.max_pending:
+                    continue
+            now = self.last = self.now
+            for p in pending:
+                yield now, p
+            pending.clear()
+
+    def flush(self) -> Generator[Tuple[int, Packet], None, None]:
+        now = self.last = self.now
+        for p in self.pending:
+            yield now, p
+        self.pending.clear()
+
+
+class ChromeTraceWriter:
+    """
+    Streams trace events as Chrome trace event JSON
+
+    Events are written as they are produced, so the size of the trace is only
+    limited by the output file. Exceptions become duration events on an
+    "exceptions" track, text written to stimulus ports becomes instant events
+    with one event per line on a track per port, and other writes to
+    stimulus ports become counter events.
+    """
+
+    PID = 1
+    EXCEPTION_TID = 1000
+
+    def __init__(self, f: TextIO, names: Optional[Callable[[int], Optional[str]]] = None) -> None:
+        """
+
+        Args:
+            f: Output text file
+            names: Function giving the name of an exception number, exception_name is used when
+                   it is not given or returns None
+        """
+        self.f = f
+        self.names = names
+        self.first = True
+        self.stack = []
+        self.lines = {}
+        self.threads = set()
+        self.events = 0
+        self.f.write('{"displayTimeUnit": "ns", "traceEvents": [\n')
+        self._event({"ph": "M", "name": "process_name", "pid": self.PID, "args": {"name": "target"}})
+
+    def _event(self, event: Dict) -> None:
+        if not self.first:
+            self.f.write(",\n")
+        self.first = False
+        self.f.write(json.dumps(event, separators=(",", ":")))
+        self.events += 1
+
+    def _thread(self, tid: int, name: str) -> None:
+        if tid not in self.threads:
+            self.threads.add(tid)
+            self._event({"ph": "M", "name": "thread_name", "pid": self.PID, "tid": tid, "args": {"name": name}})
+
+    def add(self, us: float, packet: Packet) -> None:
+        """
+        Add a packet with its absolute time in microseconds
+        """
+        kind = type(packet)
+        if kind is Stimulus:
+            tid = packet.port
+            self._thread(tid, "ITM port {}".format(tid))
+            if packet.size == 1:
+                start, line = self.lines.get(tid, (us, bytearray()))
+                if packet.value == 0x0A:
+                    self._instant(start, tid, line.rstrip(b"\r").decode("utf-8", "replace"))
+                    self.lines.pop(tid, None)
+                else:
+                    line.append(packet.value)
+                    self.lines[tid] = (start, line)
+            else:
+                self._event({"ph": "C", "name": "ITM port {}".format(tid), "ts": us, "pid": self.PID,
+                             "args": {"value": packet.value}})
+        elif kind is ExceptionTrace:
+            self._exception(us, packet)
+        elif kind is Overflow:
+            self._event({"ph": "i", "name": "ITM overflow", "ts": us, "pid": self.PID, "s": "g"})
+
+    def _instant(self, us: float, tid: int, name: str) -> None:
+        self._event({"ph": "i", "name": name, "ts": us, "pid": self.PID, "tid": tid, "s": "t"})
+
+    def _exception(self, us: float, packet: ExceptionTrace) -> None:
+        self._thread(self.EXCEPTION_TID, "exceptions")
+        if packet.function == EXC_ENTERED:
+            self.stack.append(packet.number)
+            name = (self.names(packet.number) if self.names else None) or exception_name(packet.number)
+            self._event({"ph": "B", "name": name, "ts": us, "pid": self.PID,
+                         "tid": self.EXCEPTION_TID, "args": {"exception": packet.number}})
+        elif packet.function == EXC_EXITED:
+            # An exit without an entry means the trace started inside the handler
+            if packet.number in self.stack:
+                while self.stack:
+                    number = self.stack.pop()
+                    self._event({"ph": "E", "ts": us, "pid": self.PID, "tid": self.EXCEPTION_TID})
+                    if number == packet.number:
+                        break
+
+    def close(self, us: Optional[float] = None) -> None:
+        """
+        Flush unterminated lines, close the exceptions that are still active and finish the JSON
+        """
+        for tid, (start, line) in sorted(self.lines.items()):
+            self._instant(start, tid, line.decode("utf-8", "replace"))
+        self.lines.clear()
+        if us is not None:
+            while self.stack:
+                self.stack.pop()
+                self._event({"ph": "E", "ts": us, "pid": self.PID, "tid": self.EXCEPTION_TID})
+        self.f.write("\n]}\n")
+
+
+def export_chrome_trace(packets: Iterable[Packet], f: TextIO, clk: Optional[float] = None, prescaler: int = 1,
+                        names: Optional[Callable[[int], Optional[str]]] = None) -> int:
+    """
+    Write a decoded packet stream as a Chrome trace
+
+    Args:
+        packets: Decoded ITM/DWT packets
+        f: Output text file
+        clk: Timestamp clock in Hz, usually the core clock set with dwt configclk. Without it one
+             timestamp clock cycle is shown as one microsecond
+        prescaler: ITM timestamp prescaler (ITM_TCR.TSPrescale), applied to the local timestamps only
+        names: Function giving the name of an exception number
+
+    Returns:
+        The number of events written
+    """
+    scale = 1e6 / clk if clk else 1.0
+    timestamps = TimestampReconstructor(prescaler)
+    writer = ChromeTraceWriter(f, names)
+    for ticks, packet in timestamps.feed(packets):
+        writer.add(ticks * scale, packet)
+    for ticks, packet in timestamps.flush():
+        writer.add(ticks * scale, packet)
+    writer.close(timestamps.now * scale)
+    return writer.events
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Convert an ITM/DWT trace capture to Chrome trace event JSON")
+    parser.add_argument("capture", help="Capture file, - for stdin")
+    parser.add_argument("output", help="Output JSON file, - for stdout")
+    parser.add_argument("--clk", type=float, help="Timestamp clock in Hz (default: show ticks as microseconds)")
+    parser.add_argument("--prescaler", type=int, default=1, choices=TS_PRESCALERS, help="ITM timestamp prescaler")
+    args = parser.parse_args(argv)
+
+    f = sys.stdin.buffer if args.capture == "-" else open(args.capture, "rb")
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        events = export_chrome_trace(decode_stream(f), out, args.clk, args.prescaler)
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+        if out is not sys.stdout:
+            out.close()
+    print("{} events written".format(events), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
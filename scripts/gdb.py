@@ -19,6 +19,7 @@ along with PyCortexMDebug.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import os
+import sys
 from pathlib import Path
 
 # If using the script directly from the source tree without installing
@@ -30,8 +31,8 @@ try:
 except:
     pass
 
-from cmdebug.svd_gdb import LoadSVD
-from cmdebug.dwt_gdb import DWT
+# Only lightweight stubs are registered here, the modules implementing the
+# commands (and lxml) are imported the first time each command is used
+from cmdebug.lazy_gdb import register_commands
 
-DWT()
-LoadSVD()
+register_commands()
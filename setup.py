@@ -27,7 +27,10 @@ setup(
 	keywords='arm gdb cortex cortex-m svd trace microcontroller',
 	license='GPL',
 	install_requires=[
-	  'setuptools',
 	  'lxml',
 	],
+	extras_require={
+	  # Faster TPIU deformatting
+	  'numpy': ['numpy'],
+	},
 )